@@ -7,9 +7,13 @@
 #
 # Created by Justin Lizama (jlizama2@illinois.edu) on 09/28/2018
 import numpy as np
+import json
 import math
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from tqdm import tqdm
-from collections import Counter
 import reader
 
 """
@@ -45,48 +49,259 @@ Notice that we may pass in specific values for these parameters during our testi
 """
 
 
-def pretreatment_prob(counter, laplace):
-    counter_prob = Counter()
-    prob = laplace / sum(counter.values())
-    for word in counter:
-        counter_prob[word] = counter[word] * prob / laplace
-    return prob, counter_prob
+class CountMatrix:
+    """
+    Documents as a compressed sparse row matrix of feature counts: row i holds counts data[indptr[i]:indptr[i + 1]]
+    in columns indices[indptr[i]:indptr[i + 1]].
+    """
+    def __init__(self, indptr, indices, data, width):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.width = width
 
+    def __len__(self):
+        return len(self.indptr) - 1
 
-def naiveBayes(train_set, train_labels, dev_set, laplace=0.001, pos_prior=0.75, silently=False):
+    # helper gives the row of every stored count
+    def rows(self):
+        return np.repeat(np.arange(len(self)), np.diff(self.indptr))
+
+    def dot(self, vector):
+        """Returns the matrix-vector product, one value per document"""
+        return np.bincount(self.rows(), weights=self.data * vector[self.indices], minlength=len(self))
+
+    def add_rows(self, counts, selected):
+        """Adds the counts of the documents where selected is True to counts, which has one entry per column"""
+        mask = selected[self.rows()]
+        np.add.at(counts, self.indices[mask], self.data[mask])
+
+
+class Vocabulary:
+    """
+    Maps every feature seen in training, a word or a pair of words, to a column id. Features never seen share
+    the last column, len(vocabulary), so encoded documents have len(vocabulary) + 1 columns.
+    """
+    def __init__(self):
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, docs, grow=False):
+        """Returns the documents (lists of features) as a CountMatrix, first adding their new features if grow"""
+        ids = self.ids
+        if grow:
+            docs = list(docs)
+            for doc in docs:
+                for feature in doc:
+                    if feature not in ids:
+                        ids[feature] = len(ids)
+        unseen = len(ids)
+        lengths = []
+        columns = []
+        for doc in docs:
+            lengths.append(len(doc))
+            columns.extend([ids.get(feature, unseen) for feature in doc])
+        return count_matrix(lengths, columns, unseen + 1)
+
+
+def count_matrix(lengths, columns, width):
+    """Returns the CountMatrix of documents given their lengths and the column of each of their features in order"""
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    # one key per (document, feature) pair; counting equal keys merges repeated features into one count
+    keys, counts = np.unique(rows * width + np.asarray(columns, dtype=np.int64), return_counts=True)
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(keys // width, minlength=len(lengths)))))
+    return CountMatrix(indptr, keys % width, counts.astype(float), width)
+
+
+# helper gives the pairs of neighboring words of a document, the features of the bigram model
+def bigrams(doc):
+    return list(zip(doc, doc[1:]))
+
+
+def log_likelihoods(counts, laplace):
+    """
+    Returns the smoothed log likelihood of every column given the feature counts of one class: a feature the
+    class has seen gets log(count * prob / laplace) and any other one log(prob), with prob = laplace / total.
+    """
+    prob = laplace / float(counts.sum())
+    likelihoods = np.full(len(counts), math.log(prob))
+    seen = counts > 0
+    likelihoods[seen] = np.log(counts[seen] * prob / laplace)
+    return likelihoods
+
+
+class CountModel:
+    """
+    Per-class feature counts that can be trained from any iterator of documents in batches of batch_size, so
+    memory grows with the vocabulary and not with the corpus, updated with new labeled batches at any time,
+    and merged with a model trained on another shard. features turns a document into its features, the
+    document itself (words) when None.
+    """
+    def __init__(self, features=None, batch_size=1000):
+        self.features = features
+        self.batch_size = batch_size
+        self.vocabulary = Vocabulary()
+        self.counts = {}
+
+    # helper returns the counts of a label over the current vocabulary; the array behind them at least doubles
+    # whenever it runs out of room, so growing the vocabulary one batch at a time costs amortized linear time
+    def label_counts(self, label):
+        size = len(self.vocabulary)
+        counts = self.counts.get(label, np.zeros(0))
+        if len(counts) < size:
+            grown = np.zeros(max(size, 2 * len(counts)))
+            grown[:len(counts)] = counts
+            counts = self.counts[label] = grown
+        return counts[:size]
+
+    def update(self, docs, labels):
+        """Adds the counts of the labeled documents, read batch_size at a time, and returns the model"""
+        pairs = zip(docs, labels)
+        while True:
+            batch = list(islice(pairs, self.batch_size))
+            if not batch:
+                return self
+            batch_docs, batch_labels = zip(*batch)
+            matrix = self.encode(batch_docs, grow=True)
+            batch_labels = np.asarray(batch_labels)
+            # the vocabulary grew to take every feature of the batch, so no count lands in the unseen column
+            for label in np.unique(batch_labels).tolist():
+                matrix.add_rows(self.label_counts(label), batch_labels == label)
+
+    def merge(self, other):
+        """Adds the counts of another model, trained on other documents, and returns this model"""
+        ids = self.vocabulary.ids
+        mapping = np.array([ids.setdefault(feature, len(ids)) for feature in other.vocabulary.ids], dtype=np.int64)
+        for label in other.counts:
+            self.label_counts(label)[mapping] += other.label_counts(label)
+        return self
+
+    def empty(self):
+        """Returns an untrained model with the same features and batch size"""
+        return CountModel(self.features, self.batch_size)
+
+    def encode(self, docs, grow=False):
+        """Returns the documents as a CountMatrix over this model's vocabulary"""
+        if self.features is not None:
+            docs = map(self.features, docs)
+        return self.vocabulary.encode(docs, grow)
+
+    def log_likelihoods(self, label, laplace):
+        """Returns the log likelihood of every column of encode() given the label"""
+        return log_likelihoods(np.append(self.label_counts(label), 0), laplace)
+
+
+# helper gives the text of a feature, a word or a tuple of words, which reader's whitespace split keeps unique
+def feature_text(feature):
+    return feature if isinstance(feature, str) else " ".join(feature)
+
+
+# helper gives the bucket of a feature from the crc32 of its text
+def feature_bucket(feature, width):
+    return zlib.crc32(feature_text(feature).encode()) % width
+
+
+class HashedCountModel(CountModel):
+    """
+    CountModel that hashes features into width buckets instead of giving each one a column (the hashing trick):
+    the counts of a label are one array of width floats, so memory does not grow with the vocabulary, and
+    features that share a bucket share their counts. Buckets come from crc32, which unlike hash() is the same
+    in every process, so models of different shards can still be merged.
+    """
+    def __init__(self, width, features=None, batch_size=1000):
+        super().__init__(features, batch_size)
+        self.width = width
+
+    def empty(self):
+        return HashedCountModel(self.width, self.features, self.batch_size)
+
+    def label_counts(self, label):
+        return self.counts.setdefault(label, np.zeros(self.width))
+
+    def merge(self, other):
+        if other.width != self.width:
+            raise ValueError("cannot merge models of width {} and {}".format(self.width, other.width))
+        for label, counts in other.counts.items():
+            self.label_counts(label)[:] += counts
+        return self
+
+    def encode(self, docs, grow=False):
+        if self.features is not None:
+            docs = map(self.features, docs)
+        lengths = []
+        columns = []
+        for doc in docs:
+            lengths.append(len(doc))
+            columns.extend([feature_bucket(feature, self.width) for feature in doc])
+        return count_matrix(lengths, columns, self.width)
+
+    def log_likelihoods(self, label, laplace):
+        return log_likelihoods(self.label_counts(label), laplace)
+
+    def collision_rate(self):
+        """
+        Returns the estimated share of the distinct features seen in training that landed in a bucket another
+        one already took. The number of distinct features is estimated from the share of empty buckets by
+        linear counting, since the features themselves are not kept.
+        """
+        occupied = np.count_nonzero(sum(self.counts.values()))
+        if occupied == 0:
+            return 0.0
+        if occupied == self.width:
+            return 1.0
+        distinct = -self.width * math.log(1 - occupied / self.width)
+        return 1 - occupied / distinct
+
+
+# helper gives an untrained bigram model, hashed into bigram_width buckets when a width is given so that its
+# memory no longer grows with the vocabulary
+def make_bigram_model(bigram_width=None):
+    return CountModel(bigrams) if bigram_width is None else HashedCountModel(bigram_width, bigrams)
+
+
+# helper counts one shard of the training set in a worker process into untrained copies of the models
+def train_shard(shard):
+    docs, labels, models = shard
+    return [model.update(docs, labels) for model in models]
+
+
+def train_models(train_set, train_labels, models=None, workers=None):
+    """
+    Trains the models, a single CountModel when None, on the labeled documents and returns them; models that
+    already hold counts keep them. With more than one worker the documents are split into contiguous shards
+    counted on a process pool into empty copies of the models, and the shard models are merged into the given
+    ones in order, which adds features in the order the serial update first sees them: the models end up with
+    the same columns and counts as after a serial update.
+    """
+    if models is None:
+        models = [CountModel()]
+    if workers is None or workers <= 1 or not len(train_set):
+        return [model.update(train_set, train_labels) for model in models]
+    size = math.ceil(len(train_set) / workers)
+    empty = [model.empty() for model in models]
+    shards = [(train_set[start:start + size], train_labels[start:start + size], empty)
+              for start in range(0, len(train_set), size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for shard_models in executor.map(train_shard, shards):
+            for model, shard_model in zip(models, shard_models):
+                model.merge(shard_model)
+    return list(models)
+
+
+def naiveBayes(train_set, train_labels, dev_set, laplace=0.001, pos_prior=0.75, silently=False, workers=None):
     # Keep this in the provided template
     print_paramter_vals(laplace, pos_prior)
 
-    counter_pos = Counter()
-    counter_neg = Counter()
-    for sentence_index, sentence in enumerate(train_set):
-        for word_index, word in enumerate(sentence):
-            if train_labels[sentence_index] == 1:
-                counter_pos[word] += 1
-            else:
-                counter_neg[word] += 1
-    prob_pos, counter_prob_pos = pretreatment_prob(counter_pos, laplace)
-    prob_neg, counter_prob_neg = pretreatment_prob(counter_neg, laplace)
-
-    yhats = []
-    for doc in tqdm(dev_set, disable=silently):
-        current_pos, current_neg = 0, 0
-        for word in doc:
-            if word in counter_pos:
-                current_pos += np.log(counter_prob_pos[word])
-            else:
-                current_pos += np.log(prob_pos)
-            if word in counter_neg:
-                current_neg += np.log(counter_prob_neg[word])
-            else:
-                current_neg += np.log(prob_neg)
-        current_pos += math.log(pos_prior)
-        current_neg += math.log(1 - pos_prior)
-        if current_pos > current_neg:
-            yhats.append(1)
-        else:
-            yhats.append(0)
-    return yhats
+    model, = train_models(train_set, train_labels, workers=workers)
+    dev = model.encode(tqdm(dev_set, disable=silently))
+    log_pos = model.log_likelihoods(1, laplace)
+    log_neg = model.log_likelihoods(0, laplace)
+
+    current_pos = dev.dot(log_pos) + math.log(pos_prior)
+    current_neg = dev.dot(log_neg) + math.log(1 - pos_prior)
+    return (current_pos > current_neg).astype(int).tolist()
 
 
 # Keep this in the provided template
@@ -99,59 +314,223 @@ def print_paramter_vals_bigram(unigram_laplace, bigram_laplace, bigram_lambda, p
 
 # main function for the bigrammixture model
 def bigramBayes(train_set, train_labels, dev_set, unigram_laplace=0.001, bigram_laplace=0.005, bigram_lambda=0.5,
-                pos_prior=0.5, silently=False):
+                pos_prior=0.5, silently=False, workers=None, bigram_width=None):
     # Keep this in the provided template
     print_paramter_vals_bigram(unigram_laplace, bigram_laplace, bigram_lambda, pos_prior)
 
-    counter_pos_unigram = Counter()
-    counter_neg_unigram = Counter()
-    counter_pos_bigram = Counter()
-    counter_neg_bigram = Counter()
-    for sentence_index, sentence in enumerate(train_set):
-        for word_index, word in enumerate(sentence):
-            if train_labels[sentence_index] == 1:
-                counter_pos_unigram[word] += 1
-                if word_index != len(sentence) - 1:
-                    counter_pos_bigram[(word, sentence[word_index + 1])] += 1
-            else:
-                counter_neg_unigram[word] += 1
-                if word_index != len(sentence) - 1:
-                    counter_neg_bigram[(word, sentence[word_index + 1])] += 1
-    prob_pos_unigram, counter_prob_pos_unigram = pretreatment_prob(counter_pos_unigram, unigram_laplace)
-    prob_neg_unigram, counter_prob_neg_unigram = pretreatment_prob(counter_neg_unigram, unigram_laplace)
-    prob_pos_bigram, counter_prob_pos_bigram = pretreatment_prob(counter_pos_bigram, bigram_laplace)
-    prob_neg_bigram, counter_prob_neg_bigram = pretreatment_prob(counter_neg_bigram, bigram_laplace)
-
-    yhats = []
-    for doc in tqdm(dev_set, disable=silently):
-        current_pos, current_neg = 0, 0
-        bigram_pos, bigram_neg = 0, 0
-        for word_index, word in enumerate(doc):
-            if word in counter_pos_unigram:
-                current_pos += np.log(counter_prob_pos_unigram[word])
-            else:
-                current_pos += np.log(prob_pos_unigram)
-            if word in counter_neg_unigram:
-                current_neg += np.log(counter_prob_neg_unigram[word])
+    unigram_model, bigram_model = train_models(train_set, train_labels,
+                                               (CountModel(), make_bigram_model(bigram_width)), workers)
+    if bigram_width is not None:
+        print(f"Bigram collision rate {bigram_model.collision_rate():.4f}")
+    dev_set = list(tqdm(dev_set, disable=silently))
+    unigram_dev = unigram_model.encode(dev_set)
+    bigram_dev = bigram_model.encode(dev_set)
+    log_pos_unigram = unigram_model.log_likelihoods(1, unigram_laplace)
+    log_neg_unigram = unigram_model.log_likelihoods(0, unigram_laplace)
+    log_pos_bigram = bigram_model.log_likelihoods(1, bigram_laplace)
+    log_neg_bigram = bigram_model.log_likelihoods(0, bigram_laplace)
+
+    current_pos = unigram_dev.dot(log_pos_unigram) + math.log(pos_prior)
+    current_neg = unigram_dev.dot(log_neg_unigram) + math.log(1 - pos_prior)
+    bigram_pos = bigram_dev.dot(log_pos_bigram) + math.log(pos_prior)
+    bigram_neg = bigram_dev.dot(log_neg_bigram) + math.log(1 - pos_prior)
+    total_pos = bigram_lambda * bigram_pos + (1 - bigram_lambda) * current_pos
+    total_neg = bigram_lambda * bigram_neg + (1 - bigram_lambda) * current_neg
+    return (total_pos > total_neg).astype(int).tolist()
+
+
+# helper scores every dev document against one label for each laplace value, one column per value
+def label_scores(model, dev, label, laplaces):
+    return np.stack([dev.dot(model.log_likelihoods(label, laplace)) for laplace in laplaces], axis=1)
+
+
+def sweepNaiveBayes(train_set, train_labels, dev_set, dev_labels, laplaces, pos_priors, workers=None):
+    """
+    Returns {(laplace, pos_prior): accuracy on the dev set} for every combination of the given values. The
+    training set is counted and the dev set encoded once; each laplace value then costs one matrix-vector
+    product per class and the priors are applied to all of them at once. Every accuracy is the one naiveBayes
+    gives for that combination.
+    """
+    model, = train_models(train_set, train_labels, workers=workers)
+    dev = model.encode(dev_set)
+    log_priors = np.log(np.asarray(pos_priors, dtype=float))
+    log_other_priors = np.log(1 - np.asarray(pos_priors, dtype=float))
+    # (document, laplace, prior)
+    current_pos = label_scores(model, dev, 1, laplaces)[:, :, None] + log_priors
+    current_neg = label_scores(model, dev, 0, laplaces)[:, :, None] + log_other_priors
+    correct = (current_pos > current_neg).astype(int) == np.asarray(dev_labels)[:, None, None]
+    accuracy = correct.mean(axis=0)
+    return {(laplace, pos_prior): float(accuracy[i, j]) for i, laplace in enumerate(laplaces)
+            for j, pos_prior in enumerate(pos_priors)}
+
+
+def sweepBigramBayes(train_set, train_labels, dev_set, dev_labels, unigram_laplaces, bigram_laplaces,
+                     bigram_lambdas, pos_priors, workers=None, bigram_width=None):
+    """
+    Returns {(unigram_laplace, bigram_laplace, bigram_lambda, pos_prior): accuracy on the dev set} for every
+    combination of the given values, counting once like sweepNaiveBayes. Every accuracy is the one bigramBayes
+    gives for that combination.
+    """
+    unigram_model, bigram_model = train_models(train_set, train_labels,
+                                               (CountModel(), make_bigram_model(bigram_width)), workers)
+    unigram_dev = unigram_model.encode(dev_set)
+    bigram_dev = bigram_model.encode(dev_set)
+    log_priors = np.log(np.asarray(pos_priors, dtype=float))
+    log_other_priors = np.log(1 - np.asarray(pos_priors, dtype=float))
+    lambdas = np.asarray(bigram_lambdas, dtype=float)[:, None]
+    # (document, unigram laplace, bigram laplace, lambda, prior)
+    current_pos = label_scores(unigram_model, unigram_dev, 1, unigram_laplaces)[:, :, None, None, None] + log_priors
+    current_neg = label_scores(unigram_model, unigram_dev, 0, unigram_laplaces)[:, :, None, None, None] + \
+        log_other_priors
+    bigram_pos = label_scores(bigram_model, bigram_dev, 1, bigram_laplaces)[:, None, :, None, None] + log_priors
+    bigram_neg = label_scores(bigram_model, bigram_dev, 0, bigram_laplaces)[:, None, :, None, None] + \
+        log_other_priors
+    total_pos = lambdas * bigram_pos + (1 - lambdas) * current_pos
+    total_neg = lambdas * bigram_neg + (1 - lambdas) * current_neg
+    correct = (total_pos > total_neg).astype(int) == np.asarray(dev_labels)[:, None, None, None, None]
+    accuracy = correct.mean(axis=0)
+    return {(unigram_laplace, bigram_laplace, bigram_lambda, pos_prior): float(accuracy[i, j, k, m])
+            for i, unigram_laplace in enumerate(unigram_laplaces) for j, bigram_laplace in enumerate(bigram_laplaces)
+            for k, bigram_lambda in enumerate(bigram_lambdas) for m, pos_prior in enumerate(pos_priors)}
+
+
+class LikelihoodTable:
+    """
+    Log likelihoods of one feature model for labels 0 and 1, a float32 array of shape (2, columns) whose last
+    column is the unseen feature. The features are either a sorted table of their UTF-8 texts, concatenated in
+    strings with offsets[i]:offsets[i + 1] spanning the i-th one, or, without strings, hashed into the columns.
+    """
+    def __init__(self, likelihoods, bigram, strings=None, offsets=None):
+        self.likelihoods = likelihoods
+        self.bigram = bigram
+        self.strings = strings
+        self.offsets = offsets
+
+    @classmethod
+    def from_model(cls, model, laplace, bigram):
+        """Builds the table of a trained CountModel or HashedCountModel"""
+        likelihoods = np.array([model.log_likelihoods(0, laplace), model.log_likelihoods(1, laplace)],
+                               dtype=np.float32)
+        if isinstance(model, HashedCountModel):
+            return cls(likelihoods, bigram)
+        texts = [feature_text(feature).encode() for feature in model.vocabulary.ids]
+        order = sorted(range(len(texts)), key=texts.__getitem__)
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(texts[i]) for i in order])
+        strings = np.frombuffer(b"".join(texts[i] for i in order), dtype=np.uint8)
+        # columns follow the sorted texts, the unseen column stays last
+        likelihoods = likelihoods[:, order + [len(texts)]]
+        return cls(likelihoods, bigram, strings, offsets)
+
+    # helper finds the column of a feature text by binary search over the sorted table
+    def column(self, text):
+        low, high = 0, len(self.offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if self.strings[self.offsets[middle]:self.offsets[middle + 1]].tobytes() < text:
+                low = middle + 1
             else:
-                current_neg += np.log(prob_neg_unigram)
-            if word_index != len(doc) - 1:
-                if (word, doc[word_index + 1]) in counter_pos_bigram:
-                    bigram_pos += np.log(counter_prob_pos_bigram[(word, doc[word_index + 1])])
-                else:
-                    bigram_pos += np.log(prob_pos_bigram)
-                if (word, doc[word_index + 1]) in counter_neg_bigram:
-                    bigram_neg += np.log(counter_prob_neg_bigram[(word, doc[word_index + 1])])
-                else:
-                    bigram_neg += np.log(prob_neg_bigram)
-        bigram_pos += math.log(pos_prior)
-        bigram_neg += math.log(1 - pos_prior)
-        current_pos += math.log(pos_prior)
-        current_neg += math.log(1 - pos_prior)
-        total_pos = bigram_lambda * bigram_pos + (1 - bigram_lambda) * current_pos
-        total_neg = bigram_lambda * bigram_neg + (1 - bigram_lambda) * current_neg
-        if total_pos > total_neg:
-            yhats.append(1)
-        else:
-            yhats.append(0)
-    return yhats
+                high = middle
+        if low < len(self.offsets) - 1 and self.strings[self.offsets[low]:self.offsets[low + 1]].tobytes() == text:
+            return low
+        return len(self.offsets) - 1
+
+    def encode(self, docs):
+        """Returns the documents as a CountMatrix over the columns of the table"""
+        width = self.likelihoods.shape[1]
+        # each distinct feature is searched once per call
+        columns_of = {}
+        lengths = []
+        columns = []
+        for doc in docs:
+            features = bigrams(doc) if self.bigram else doc
+            lengths.append(len(features))
+            for feature in features:
+                column = columns_of.get(feature)
+                if column is None:
+                    column = feature_bucket(feature, width) if self.strings is None else \
+                        self.column(feature_text(feature).encode())
+                    columns_of[feature] = column
+                columns.append(column)
+        return count_matrix(lengths, columns, width)
+
+    def save(self, directory, name):
+        np.save(os.path.join(directory, name + "_likelihoods.npy"), self.likelihoods)
+        if self.strings is not None:
+            np.save(os.path.join(directory, name + "_strings.npy"), self.strings)
+            np.save(os.path.join(directory, name + "_offsets.npy"), self.offsets)
+
+    @classmethod
+    def load(cls, directory, name, bigram, hashed):
+        def array(part):
+            return np.load(os.path.join(directory, "{}_{}.npy".format(name, part)), mmap_mode='r')
+        if hashed:
+            return cls(array("likelihoods"), bigram)
+        return cls(array("likelihoods"), bigram, array("strings"), array("offsets"))
+
+
+class NaiveBayesModel:
+    """
+    Trained unigram model, or unigram/bigram mixture, that can be saved to a directory and loaded back without
+    retraining. save() writes every table as a .npy file next to a small JSON header; load() memory-maps the
+    tables read-only instead of reading them, so scoring processes that load the same directory share one
+    physical copy through the page cache.
+    """
+    FORMAT = 1
+
+    def __init__(self, unigram, pos_prior, bigram=None, bigram_lambda=0.5):
+        self.unigram = unigram
+        self.bigram = bigram
+        self.pos_prior = pos_prior
+        self.bigram_lambda = bigram_lambda
+
+    @classmethod
+    def train(cls, train_set, train_labels, laplace=0.001, pos_prior=0.5, bigram_laplace=None, bigram_lambda=0.5,
+              bigram_width=None, workers=None):
+        """Trains a unigram model, or a unigram/bigram mixture when bigram_laplace is given"""
+        if bigram_laplace is None:
+            unigram_model, = train_models(train_set, train_labels, workers=workers)
+            return cls(LikelihoodTable.from_model(unigram_model, laplace, False), pos_prior)
+        unigram_model, bigram_model = train_models(train_set, train_labels,
+                                                   (CountModel(), make_bigram_model(bigram_width)), workers)
+        return cls(LikelihoodTable.from_model(unigram_model, laplace, False), pos_prior,
+                   LikelihoodTable.from_model(bigram_model, bigram_laplace, True), bigram_lambda)
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        tables = {"unigram": self.unigram} if self.bigram is None else {"unigram": self.unigram, "bigram": self.bigram}
+        for name, table in tables.items():
+            table.save(directory, name)
+        header = {
+            "format": self.FORMAT,
+            "pos_prior": self.pos_prior,
+            "bigram_lambda": self.bigram_lambda,
+            "tables": {name: {"hashed": table.strings is None} for name, table in tables.items()},
+        }
+        with open(os.path.join(directory, "header.json"), "w") as file:
+            json.dump(header, file, indent=2)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "header.json")) as file:
+            header = json.load(file)
+        if header["format"] != cls.FORMAT:
+            raise ValueError("unsupported model format {}".format(header["format"]))
+        tables = {name: LikelihoodTable.load(directory, name, name == "bigram", table["hashed"])
+                  for name, table in header["tables"].items()}
+        return cls(tables["unigram"], header["pos_prior"], tables.get("bigram"), header["bigram_lambda"])
+
+    def predict_batch(self, docs):
+        """Returns the predicted label, 1 or 0, of every document, each a list of words"""
+        docs = list(docs)
+        unigram_dev = self.unigram.encode(docs)
+        current_pos = unigram_dev.dot(self.unigram.likelihoods[1]) + math.log(self.pos_prior)
+        current_neg = unigram_dev.dot(self.unigram.likelihoods[0]) + math.log(1 - self.pos_prior)
+        if self.bigram is None:
+            return (current_pos > current_neg).astype(int).tolist()
+        bigram_dev = self.bigram.encode(docs)
+        bigram_pos = bigram_dev.dot(self.bigram.likelihoods[1]) + math.log(self.pos_prior)
+        bigram_neg = bigram_dev.dot(self.bigram.likelihoods[0]) + math.log(1 - self.pos_prior)
+        total_pos = self.bigram_lambda * bigram_pos + (1 - self.bigram_lambda) * current_pos
+        total_neg = self.bigram_lambda * bigram_neg + (1 - self.bigram_lambda) * current_neg
+        return (total_pos > total_neg).astype(int).tolist()
@@ -31,6 +31,8 @@ dev_set - A Numpy array of 32x32x3 images of shape [2500, 3072].
 return - a list containing predicted labels for dev_set
 """
 
+import json
+import os
 import numpy as np
 
 
@@ -62,18 +64,150 @@ def classifyPerceptron(train_set, train_labels, dev_set, learning_rate, max_iter
     return return_list
 
 
-def classifyKNN(train_set, train_labels, dev_set, k):
+def nearest_neighbors(train_set, dev_set, k, memory=1 << 28):
+    """
+    Returns the indices of the k nearest training vectors of every dev vector, nearest first, and their squared
+    distances, both of shape [len(dev_set), k]. Squared distances are computed as ||a||^2 + ||b||^2 - 2ab^T
+    with one matrix product per chunk of dev vectors, the chunks sized so that their distance matrix takes
+    about memory bytes, and the k smallest of each row are picked with argpartition instead of a full sort.
+    """
+    train_set = np.asarray(train_set)
+    dev_set = np.asarray(dev_set)
+    if not np.issubdtype(train_set.dtype, np.floating):
+        train_set = train_set.astype(float)
+    train_norms = np.einsum('ij,ij->i', train_set, train_set)
+    rows = max(1, memory // (train_set.dtype.itemsize * len(train_set)))
+    indices = np.empty((len(dev_set), k), dtype=np.int64)
+    distances = np.empty((len(dev_set), k), dtype=train_set.dtype)
+    for start in range(0, len(dev_set), rows):
+        chunk = dev_set[start:start + rows].astype(train_set.dtype)
+        squared = train_norms - 2 * (chunk @ train_set.T)
+        squared += np.einsum('ij,ij->i', chunk, chunk)[:, None]
+        # rounding can leave identical vectors slightly below zero
+        np.maximum(squared, 0, out=squared)
+        nearest = np.argpartition(squared, k - 1, axis=1)[:, :k]
+        nearest_squared = np.take_along_axis(squared, nearest, axis=1)
+        order = np.argsort(nearest_squared, axis=1, kind='stable')
+        indices[start:start + rows] = np.take_along_axis(nearest, order, axis=1)
+        distances[start:start + rows] = np.take_along_axis(nearest_squared, order, axis=1)
+    return indices, distances
+
+
+class IVFIndex:
+    """
+    Approximate nearest neighbor index over training vectors (an inverted file): k-means splits the vectors into
+    nlist lists around centroids, and a query only searches the nprobe lists whose centroids are nearest to it.
+    Raising nprobe trades speed for recall, up to exact search at nprobe = nlist; recall() measures it against
+    exact search. The vectors of each list are stored contiguously, so save() and load() keep them as .npy
+    files that are memory-mapped rather than read.
+    """
+    FORMAT = 1
+
+    def __init__(self, centroids, vectors, ids, offsets, labels, nprobe=8, memory=1 << 28):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+        self.labels = labels
+        self.nprobe = nprobe
+        self.memory = memory
+
+    @classmethod
+    def build(cls, train_set, train_labels, nlist=None, nprobe=8, iterations=10, sample=256, seed=0, memory=1 << 28):
+        """
+        Clusters the training vectors into nlist lists, about the square root of their number by default. The
+        centroids are fit by k-means on at most sample vectors per list and then every vector joins the list
+        of its nearest centroid.
+        """
+        vectors = np.asarray(train_set)
+        if not np.issubdtype(vectors.dtype, np.floating):
+            vectors = vectors.astype(float)
+        nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+        rng = np.random.default_rng(seed)
+        fit = vectors[rng.choice(len(vectors), min(len(vectors), nlist * sample), replace=False)]
+        centroids = fit[rng.choice(len(fit), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            nearest = nearest_neighbors(centroids, fit, 1, memory)[0][:, 0]
+            grouped = fit[np.argsort(nearest, kind='stable')]
+            bounds = np.concatenate(([0], np.cumsum(np.bincount(nearest, minlength=nlist))))
+            for index in range(nlist):
+                # an empty list keeps its centroid
+                if bounds[index] < bounds[index + 1]:
+                    centroids[index] = grouped[bounds[index]:bounds[index + 1]].mean(axis=0)
+        assignment = nearest_neighbors(centroids, vectors, 1, memory)[0][:, 0]
+        ids = np.argsort(assignment, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=nlist))))
+        return cls(centroids, vectors[ids], ids, offsets, np.asarray(train_labels), nprobe, memory)
+
+    def search(self, queries, k, nprobe=None):
+        """
+        Returns the indices into the training set of the approximate k nearest neighbors of every query,
+        nearest first, and their squared distances. A query whose probed lists hold fewer than k vectors gets
+        index -1 and distance inf in the missing places.
+        """
+        queries = np.asarray(queries, dtype=self.vectors.dtype)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = nearest_neighbors(self.centroids, queries, nprobe, self.memory)[0]
+        best = np.full((len(queries), k), np.inf)
+        best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+        # (list, query) pairs grouped by list, so each list is read once for all the queries probing it
+        lists = probes.ravel()
+        order = np.argsort(lists, kind='stable')
+        pair_queries = np.repeat(np.arange(len(queries)), nprobe)[order]
+        bounds = np.searchsorted(lists[order], np.arange(len(self.centroids) + 1))
+        for index in range(len(self.centroids)):
+            start, end = self.offsets[index], self.offsets[index + 1]
+            if bounds[index] == bounds[index + 1] or start == end:
+                continue
+            members = pair_queries[bounds[index]:bounds[index + 1]]
+            vectors = self.vectors[start:end]
+            squared = np.einsum('ij,ij->i', vectors, vectors) - 2 * (queries[members] @ vectors.T)
+            squared += query_norms[members, None]
+            np.maximum(squared, 0, out=squared)
+            candidates = np.concatenate((best[members], squared), axis=1)
+            candidate_ids = np.concatenate((best_ids[members], np.broadcast_to(self.ids[start:end], squared.shape)),
+                                           axis=1)
+            nearest = np.argpartition(candidates, k - 1, axis=1)[:, :k]
+            best[members] = np.take_along_axis(candidates, nearest, axis=1)
+            best_ids[members] = np.take_along_axis(candidate_ids, nearest, axis=1)
+        order = np.argsort(best, axis=1, kind='stable')
+        return np.take_along_axis(best_ids, order, axis=1), np.take_along_axis(best, order, axis=1)
+
+    def recall(self, queries, k, nprobe=None):
+        """Returns the share of the exact k nearest neighbors of held-out queries that search() finds"""
+        exact = self.ids[nearest_neighbors(self.vectors, queries, k, self.memory)[0]]
+        found = self.search(queries, k, nprobe)[0]
+        return float((found[:, :, None] == exact[:, None, :]).any(axis=2).mean())
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for name in ("centroids", "vectors", "ids", "offsets", "labels"):
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+        with open(os.path.join(directory, "header.json"), "w") as file:
+            json.dump({"format": self.FORMAT, "nprobe": self.nprobe}, file, indent=2)
+
+    @classmethod
+    def load(cls, directory, memory=1 << 28):
+        with open(os.path.join(directory, "header.json")) as file:
+            header = json.load(file)
+        if header["format"] != cls.FORMAT:
+            raise ValueError("unsupported index format {}".format(header["format"]))
+        arrays = [np.load(os.path.join(directory, name + ".npy"), mmap_mode='r')
+                  for name in ("centroids", "vectors", "ids", "offsets", "labels")]
+        return cls(*arrays, nprobe=header["nprobe"], memory=memory)
+
+
+def classifyKNN(train_set, train_labels, dev_set, k, memory=1 << 28):
     # TODO: Write your code here
-    return_list = []
-    for i in dev_set:
-        temp = []
-        sort = {}
-        for index, j in enumerate(train_set):
-            sort[np.linalg.norm(i - j)] = index
-            temp.append(np.linalg.norm(i - j))
-        temp = sorted(temp)
-        total = 0
-        for index in range(k):
-            total += train_labels[sort[temp[index]]]
-        return_list.append(total > k / 2)
-    return return_list
+    # train_set may be an IVFIndex, searched approximately; its own labels are used when train_labels is None
+    if isinstance(train_set, IVFIndex):
+        neighbors, _ = train_set.search(dev_set, k)
+        labels = train_set.labels if train_labels is None else np.asarray(train_labels)
+        # missing neighbors (-1) do not vote
+        votes = np.where(neighbors >= 0, labels[neighbors], 0).sum(axis=1)
+        return (votes > k / 2).tolist()
+    # every neighbor is a distinct training vector, so tied distances no longer overwrite each other
+    neighbors, _ = nearest_neighbors(train_set, dev_set, k, memory)
+    votes = np.asarray(train_labels)[neighbors].sum(axis=1)
+    return (votes > k / 2).tolist()
@@ -17,26 +17,102 @@ import numpy as np
 from alien import Alien
 
 
+# squares are written as products so the scalar checks and the vectorized grid checks below round identically
 def line_length(x1, y1, x2, y2):
-    return math.sqrt(math.pow((x2 - x1), 2) + math.pow((y2 - y1), 2))
+    return math.sqrt((x2 - x1) * (x2 - x1) + (y2 - y1) * (y2 - y1))
 
 
-def point_to_line_distance(point, line, radius, granularity=0):
-    bound = granularity / math.sqrt(2)
+def point_to_segment_distance(point, segment):
+    """Exact distance from a point to a segment, which may have zero length"""
     px, py = point
-    x1, y1, x2, y2 = line
-    line_distance = line_length(x1, y1, x2, y2)
-    if line_distance == 0:
-        return False
-    u = (((px - x1) * (x2 - x1)) + ((py - y1) * (y2 - y1))) / math.pow(line_distance, 2)
-    if u <= 0:
-        return line_length(px, py, x1, y1) - radius - bound <= 0
-    elif u >= 1:
-        return line_length(px, py, x2, y2) - radius - bound <= 0
-    else:
-        ix = x1 + u * (x2 - x1)
-        iy = y1 + u * (y2 - y1)
-        return line_length(px, py, ix, iy) - radius - bound <= 0
+    x1, y1, x2, y2 = segment
+    dx, dy = x2 - x1, y2 - y1
+    length_squared = dx * dx + dy * dy
+    u = 0 if length_squared == 0 else min(max(((px - x1) * dx + (py - y1) * dy) / length_squared, 0), 1)
+    return line_length(px, py, x1 + u * dx, y1 + u * dy)
+
+
+# helper gives the side of line (x1, y1)-(x2, y2) that point (px, py) lies on: positive, negative or 0 on it
+def orientation(x1, y1, x2, y2, px, py):
+    return (x2 - x1) * (py - y1) - (y2 - y1) * (px - x1)
+
+
+def segment_to_segment_distance(segment_a, segment_b):
+    """
+    Exact distance between two segments: 0 when they cross, otherwise the smallest distance from an
+    endpoint of one segment to the other segment (which also covers touching and collinear overlaps)
+    """
+    ax1, ay1, ax2, ay2 = segment_a
+    bx1, by1, bx2, by2 = segment_b
+    d1 = orientation(bx1, by1, bx2, by2, ax1, ay1)
+    d2 = orientation(bx1, by1, bx2, by2, ax2, ay2)
+    d3 = orientation(ax1, ay1, ax2, ay2, bx1, by1)
+    d4 = orientation(ax1, ay1, ax2, ay2, bx2, by2)
+    if ((d1 > 0 and d2 < 0) or (d1 < 0 and d2 > 0)) and ((d3 > 0 and d4 < 0) or (d3 < 0 and d4 > 0)):
+        return 0.0
+    return min(point_to_segment_distance((ax1, ay1), segment_b), point_to_segment_distance((ax2, ay2), segment_b),
+               point_to_segment_distance((bx1, by1), segment_a), point_to_segment_distance((bx2, by2), segment_a))
+
+
+# helper returns the alien's body as a segment from head to tail, a single point for the ball
+def alien_segment(alien):
+    head, tail = alien.get_head_and_tail()
+    return head[0], head[1], tail[0], tail[1]
+
+
+# helper returns the (min x, min y, max x, max y) box around a segment grown by padding on every side
+def segment_box(segment, padding):
+    x1, y1, x2, y2 = segment
+    return min(x1, x2) - padding, min(y1, y2) - padding, max(x1, x2) + padding, max(y1, y2) + padding
+
+
+class SpatialIndex:
+    """
+    Uniform grid of square buckets over the bounding boxes of wall segments and goal circles. A query
+    with a box returns, in their original order, only the walls and goals whose boxes overlap it, so a
+    check near the alien costs O(nearby objects) instead of O(all objects).
+
+    An index can be passed in place of the walls or goals list to the checks in this file and to
+    transformToMaze.
+    """
+    def __init__(self, walls, goals, cell_size):
+        self.walls = list(walls)
+        self.goals = list(goals)
+        self.cell_size = cell_size
+        self.wall_boxes = [segment_box(wall, 0) for wall in self.walls]
+        self.goal_boxes = [(x - r, y - r, x + r, y + r) for x, y, r in self.goals]
+        boxes = self.wall_boxes + self.goal_boxes
+        self.extent = (math.floor(min((box[0] for box in boxes), default=0) / cell_size),
+                       math.floor(min((box[1] for box in boxes), default=0) / cell_size),
+                       math.floor(max((box[2] for box in boxes), default=0) / cell_size),
+                       math.floor(max((box[3] for box in boxes), default=0) / cell_size))
+        self.wall_buckets = {}
+        self.goal_buckets = {}
+        for buckets, boxes in ((self.wall_buckets, self.wall_boxes), (self.goal_buckets, self.goal_boxes)):
+            for index, box in enumerate(boxes):
+                for bucket in self.buckets(box):
+                    buckets.setdefault(bucket, []).append(index)
+
+    # helper lists the buckets a box overlaps, clipped to the buckets that can hold anything
+    def buckets(self, box):
+        size = self.cell_size
+        return [(i, j) for i in range(max(math.floor(box[0] / size), self.extent[0]),
+                                      min(math.floor(box[2] / size), self.extent[2]) + 1)
+                for j in range(max(math.floor(box[1] / size), self.extent[1]),
+                               min(math.floor(box[3] / size), self.extent[3]) + 1)]
+
+    # helper returns the objects whose boxes overlap box, looking only at the buckets box covers
+    def query(self, objects, boxes, buckets, box):
+        candidates = {index for bucket in self.buckets(box) for index in buckets.get(bucket, ())}
+        return [objects[index] for index in sorted(candidates)
+                if boxes[index][0] <= box[2] and box[0] <= boxes[index][2] and
+                boxes[index][1] <= box[3] and box[1] <= boxes[index][3]]
+
+    def walls_near(self, box):
+        return self.query(self.walls, self.wall_boxes, self.wall_buckets, box)
+
+    def goals_near(self, box):
+        return self.query(self.goals, self.goal_boxes, self.goal_buckets, box)
 
 
 def does_alien_touch_wall(alien, walls, granularity):
@@ -45,32 +121,21 @@ def does_alien_touch_wall(alien, walls, granularity):
         Args:
             alien (Alien): Instance of Alien class that will be navigating our map
             walls (list): List of endpoints of line segments that comprise the walls in the maze in the format
-            [(startx, starty, endx, endx), ...]
+            [(startx, starty, endx, endx), ...], or a SpatialIndex over them
             granularity (int): The granularity of the map
 
         Return:
             True if touched, False if not
     """
-    if alien.is_circle():
-        center = alien.get_centroid()
-        for wall in walls:
-            if point_to_line_distance(center, wall, alien.get_width(), granularity):
-                return True
-    else:
-        head_and_tail = alien.get_head_and_tail()
-        for wall in walls:
-            if np.isclose(head_and_tail[0][0], head_and_tail[1][0]):
-                point_y = min(head_and_tail[0][1], head_and_tail[1][1])
-                while point_y <= max(head_and_tail[0][1], head_and_tail[1][1]):
-                    if point_to_line_distance((head_and_tail[0][0], point_y), wall, alien.get_width(), granularity):
-                        return True
-                    point_y += 1
-            else:
-                point_x = min(head_and_tail[0][0], head_and_tail[1][0])
-                while point_x <= max(head_and_tail[0][0], head_and_tail[1][0]):
-                    if point_to_line_distance((point_x, head_and_tail[0][1]), wall, alien.get_width(), granularity):
-                        return True
-                    point_x += 1
+    # the alien is a capsule around its head-tail segment, so it touches a wall when the two segments are
+    # within its width, padded by half the diagonal of a map cell
+    reach = alien.get_width() + granularity / math.sqrt(2)
+    body = alien_segment(alien)
+    if isinstance(walls, SpatialIndex):
+        walls = walls.walls_near(segment_box(body, reach))
+    for wall in walls:
+        if segment_to_segment_distance(body, wall) <= reach:
+            return True
     return False
 
 
@@ -79,24 +144,18 @@ def does_alien_touch_goal(alien, goals):
 
         Args:
             alien (Alien): Instance of Alien class that will be navigating our map
-            goals (list): x, y coordinate and radius of goals in the format [(x, y, r), ...].
-            There can be multiple goals
+            goals (list): x, y coordinate and radius of goals in the format [(x, y, r), ...], or a SpatialIndex
+            over them. There can be multiple goals
 
         Return:
             True if a goal is touched, False if not.
     """
-    if alien.is_circle():
-        center = alien.get_centroid()
-        for goal in goals:
-            if math.sqrt(math.pow((goal[0] - center[0]), 2) + math.pow((goal[1] - center[1]), 2)) <=\
-                    goal[2] + alien.get_width():
-                return True
-    else:
-        for goal in goals:
-            line = (alien.get_head_and_tail()[0][0], alien.get_head_and_tail()[0][1],
-                    alien.get_head_and_tail()[1][0], alien.get_head_and_tail()[1][1])
-            if point_to_line_distance((goal[0], goal[1]), line, goal[2] + alien.get_width()):
-                return True
+    body = alien_segment(alien)
+    if isinstance(goals, SpatialIndex):
+        goals = goals.goals_near(segment_box(body, alien.get_width()))
+    for goal in goals:
+        if point_to_segment_distance((goal[0], goal[1]), body) <= goal[2] + alien.get_width():
+            return True
     return False
 
 
@@ -113,3 +172,92 @@ def is_alien_within_window(alien, window, granularity):
              (0, window[1], window[0], window[1]),
              (window[0], 0, window[0], window[1])]
     return not does_alien_touch_wall(alien, walls, granularity)
+
+
+"""
+Grid versions of the checks above. Each one evaluates the alien in its current shape at every centroid
+(x, y) with x taken from xs and y from ys, and returns a boolean array of shape (len(xs), len(ys)) that
+matches calling the scalar check once per centroid.
+"""
+
+
+def point_to_segment_distance_grid(px, py, x1, y1, x2, y2):
+    """Vectorized point_to_segment_distance where the points and the segment endpoints may all be arrays"""
+    dx, dy = x2 - x1, y2 - y1
+    length_squared = dx * dx + dy * dy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        u = np.where(length_squared == 0, 0, np.clip(((px - x1) * dx + (py - y1) * dy) / length_squared, 0, 1))
+    ix = x1 + u * dx
+    iy = y1 + u * dy
+    return np.sqrt((ix - px) * (ix - px) + (iy - py) * (iy - py))
+
+
+def segment_to_segment_distance_grid(ax1, ay1, ax2, ay2, bx1, by1, bx2, by2):
+    """Vectorized segment_to_segment_distance where all endpoints may be arrays"""
+    d1 = orientation(bx1, by1, bx2, by2, ax1, ay1)
+    d2 = orientation(bx1, by1, bx2, by2, ax2, ay2)
+    d3 = orientation(ax1, ay1, ax2, ay2, bx1, by1)
+    d4 = orientation(ax1, ay1, ax2, ay2, bx2, by2)
+    crossing = (((d1 > 0) & (d2 < 0)) | ((d1 < 0) & (d2 > 0))) & (((d3 > 0) & (d4 < 0)) | ((d3 < 0) & (d4 > 0)))
+    distance = np.minimum(
+        np.minimum(point_to_segment_distance_grid(ax1, ay1, bx1, by1, bx2, by2),
+                   point_to_segment_distance_grid(ax2, ay2, bx1, by1, bx2, by2)),
+        np.minimum(point_to_segment_distance_grid(bx1, by1, ax1, ay1, ax2, ay2),
+                   point_to_segment_distance_grid(bx2, by2, ax1, ay1, ax2, ay2)))
+    return np.where(crossing, 0.0, distance)
+
+
+def alien_offsets(alien):
+    """Returns the head and tail of the alien in its current shape relative to its centroid"""
+    config = alien.get_config()
+    alien.set_alien_config([0, 0, config[2]])
+    head, tail = alien.get_head_and_tail()
+    alien.set_alien_config(config)
+    return head, tail
+
+
+# helper returns the head-tail segments of the alien at every centroid of the grid, broadcast to (xs, ys)
+def alien_segment_grid(alien, xs, ys):
+    xs = np.asarray(xs, dtype=float)[:, None]
+    ys = np.asarray(ys, dtype=float)[None, :]
+    head, tail = alien_offsets(alien)
+    return xs + head[0], ys + head[1], xs + tail[0], ys + tail[1]
+
+
+# helper returns the box around every body of the grid grown by padding
+def segment_box_grid(body, padding):
+    x1, y1, x2, y2 = body
+    return (min(x1.min(), x2.min()) - padding, min(y1.min(), y2.min()) - padding,
+            max(x1.max(), x2.max()) + padding, max(y1.max(), y2.max()) + padding)
+
+
+def does_alien_touch_wall_grid(alien, xs, ys, walls, granularity):
+    """Grid version of does_alien_touch_wall"""
+    reach = alien.get_width() + granularity / math.sqrt(2)
+    body = alien_segment_grid(alien, xs, ys)
+    touched = np.zeros((len(xs), len(ys)), dtype=bool)
+    if isinstance(walls, SpatialIndex):
+        walls = walls.walls_near(segment_box_grid(body, reach))
+    for wall in walls:
+        touched |= segment_to_segment_distance_grid(*body, *wall) <= reach
+    return touched
+
+
+def does_alien_touch_goal_grid(alien, xs, ys, goals):
+    """Grid version of does_alien_touch_goal"""
+    body = alien_segment_grid(alien, xs, ys)
+    touched = np.zeros((len(xs), len(ys)), dtype=bool)
+    if isinstance(goals, SpatialIndex):
+        goals = goals.goals_near(segment_box_grid(body, alien.get_width()))
+    for goal in goals:
+        touched |= point_to_segment_distance_grid(goal[0], goal[1], *body) <= goal[2] + alien.get_width()
+    return touched
+
+
+def is_alien_within_window_grid(alien, xs, ys, window, granularity):
+    """Grid version of is_alien_within_window"""
+    walls = [(0, 0, window[0], 0),
+             (0, 0, 0, window[1]),
+             (0, window[1], window[0], window[1]),
+             (window[0], 0, window[0], window[1])]
+    return ~does_alien_touch_wall_grid(alien, xs, ys, walls, granularity)
@@ -12,7 +12,12 @@ This file contains the transform function that converts the robot arm map
 to the maze.
 """
 import copy
+import hashlib
+import json
+import math
 # from arm import Arm
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 from maze import Maze
 from search import *
 from geometry import *
@@ -21,7 +26,7 @@ from util import *
 import os
 
 
-def transformToMaze(alien, goals, walls, window, granularity):
+def transformToMaze(alien, goals, walls, window, granularity, workers=None, index=None, cache=None):
     """This function transforms the given 2D map to the maze in MP1.
 
         Args:
@@ -29,6 +34,10 @@ def transformToMaze(alien, goals, walls, window, granularity):
             goals (list): [(x, y, r)] of goals
             walls (list): [(startx, starty, endx, endy)] of walls
             window (tuple): (width, height) of the window
+            workers (int): number of processes that build the map in tiles, None or 1 builds it in this process
+            index (SpatialIndex): index over the walls and goals, used in their place so that each tile of the
+                map is only checked against the walls and goals near it
+            cache (MapCache): on-disk cache of maps, a hit skips building the map and memory-maps it instead
 
         Return:
             Maze: the maze instance generated based on input arguments.
@@ -37,20 +46,392 @@ def transformToMaze(alien, goals, walls, window, granularity):
     begin_config = alien.get_config()
     rows = int(window[0] / granularity + 1)
     cols = int(window[1] / granularity + 1)
-    maze_map = np.full((rows, cols, 3), SPACE_CHAR)
     offset = [0, 0, 0]
 
-    for index in np.ndindex(rows, cols, 3):
-        config = idxToConfig(index, offset, granularity, alien)
-        alien.set_alien_config(config)
-        not_within = not is_alien_within_window(alien, window, granularity)
-        touch_wall = does_alien_touch_wall(alien, walls, granularity)
-        touch_goal = does_alien_touch_goal(alien, goals)
-        if not_within or touch_wall:
-            maze_map[index] = WALL_CHAR
-        elif touch_goal:
-            maze_map[index] = OBJECTIVE_CHAR
+    # the centroid x only depends on the row and y only on the column, so each shape is one broadcast check
+    xs = [idxToConfig((row, 0, 0), offset, granularity, alien)[0] for row in range(rows)]
+    ys = [idxToConfig((0, col, 0), offset, granularity, alien)[1] for col in range(cols)]
+    if index is not None:
+        walls = goals = index
+    key = maze_map = None
+    if cache is not None:
+        key = cache.key(alien, goals, walls, window, granularity)
+        maze_map = cache.load(key)
+    if maze_map is None:
+        if workers is None or workers <= 1:
+            maze_map = np.full((rows, cols, 3), SPACE_CHAR)
+            # with an index, tiles about one bucket wide keep the candidate lists short; at least 16 cells wide,
+            # smaller tiles spend their time in per-call overhead
+            side = max(rows, cols) if index is None else max(16, math.ceil(index.cell_size / granularity))
+            for (row_start, row_end), (col_start, col_end) in map_tiles(rows, cols, side):
+                fill_tile(maze_map[row_start:row_end, col_start:col_end], alien, goals, walls, window,
+                          granularity, xs[row_start:row_end], ys[col_start:col_end])
+        else:
+            maze_map = fill_tiles_parallel(alien, goals, walls, window, granularity, xs, ys, workers)
+        if cache is not None:
+            # the start depends on the alien's configuration, not the floor plan, so it is stored as a space
+            maze_map = cache.store(key, maze_map)
+    alien.set_alien_config(begin_config)
 
     idx = configToIdx(begin_config, offset, granularity, alien)
     maze_map[idx[0]][idx[1]][idx[2]] = START_CHAR
     return Maze(maze_map, alien, granularity)
+
+
+def updateMaze(maze, goals, walls, window, added_walls=(), removed_walls=(), added_goals=(), removed_goals=()):
+    """Patches a maze built by transformToMaze in place after some walls or goals were added or removed.
+
+        Only the cells whose centroid is close enough to a changed wall or goal for the alien to reach it in
+        some shape are recomputed, so the cost follows the size of the change rather than the size of the map.
+
+        Args:
+            maze (Maze): maze returned by transformToMaze for the walls and goals before the change
+            goals (list): [(x, y, r)] of goals after the change, or a SpatialIndex over them
+            walls (list): [(startx, starty, endx, endy)] of walls after the change, or a SpatialIndex over them
+            window (tuple): (width, height) of the window
+            added_walls, removed_walls (list): walls that were added and removed
+            added_goals, removed_goals (list): goals that were added and removed
+
+        Return:
+            Maze: the same maze instance, updated
+    """
+    alien = copy.deepcopy(maze.alien)
+    granularity = maze.granularity
+    offset = [0, 0, 0]
+    maze_map = maze.get_map()
+    rows, cols, _ = maze.getDimensions()
+
+    # farthest a centroid can be from a changed object and still have the alien, in any shape, touch it
+    margin = 0
+    for shape in alien.get_shapes():
+        alien.set_alien_config([0, 0, shape])
+        head, tail = alien_offsets(alien)
+        margin = max(margin, max(abs(value) for value in head + tail) + alien.get_width())
+    margin += granularity / math.sqrt(2)
+    # each patched tile only needs the walls and goals near it, which an index finds without scanning them all
+    if not isinstance(walls, SpatialIndex) or not isinstance(goals, SpatialIndex):
+        walls = goals = SpatialIndex(walls.walls if isinstance(walls, SpatialIndex) else walls,
+                                     goals.goals if isinstance(goals, SpatialIndex) else goals, 2 * margin)
+
+    boxes = [segment_box(wall, margin) for wall in list(added_walls) + list(removed_walls)]
+    boxes += [(x - r - margin, y - r - margin, x + r + margin, y + r + margin)
+              for x, y, r in list(added_goals) + list(removed_goals)]
+    tiles = []
+    for box in boxes:
+        row_start, row_end = max(0, math.floor(box[0] / granularity)), min(rows, math.ceil(box[2] / granularity) + 1)
+        col_start, col_end = max(0, math.floor(box[1] / granularity)), min(cols, math.ceil(box[3] / granularity) + 1)
+        if row_start < row_end and col_start < col_end:
+            tiles.append(((row_start, row_end), (col_start, col_end)))
+
+    objectives = set()
+    for (row_start, row_end), (col_start, col_end) in tiles:
+        xs = [idxToConfig((row, 0, 0), offset, granularity, alien)[0] for row in range(row_start, row_end)]
+        ys = [idxToConfig((0, col, 0), offset, granularity, alien)[1] for col in range(col_start, col_end)]
+        tile = np.full((row_end - row_start, col_end - col_start, 3), SPACE_CHAR)
+        fill_tile(tile, alien, goals, walls, window, granularity, xs, ys)
+        maze_map[row_start:row_end, col_start:col_end] = tile
+        objectives.update((row_start + row, col_start + col, shape)
+                          for row, col, shape in zip(*np.nonzero(tile == OBJECTIVE_CHAR)))
+
+    # tiles can overlap, so objectives are only kept or dropped once every tile is written
+    def patched(index):
+        return any(row_start <= index[0] < row_end and col_start <= index[1] < col_end
+                   for (row_start, row_end), (col_start, col_end) in tiles)
+    for objective in maze.getObjectives():
+        index = configToIdx(objective, offset, granularity, alien)
+        if not patched(index):
+            objectives.add(index)
+    start = configToIdx(maze.getStart(), offset, granularity, alien)
+    maze_map[start[0]][start[1]][start[2]] = START_CHAR
+    objectives.discard(start)
+    maze.setObjectives([idxToConfig(index, offset, granularity, alien) for index in sorted(objectives)])
+    return maze
+
+
+class MapCache:
+    """
+    Content-addressed on-disk cache of the maps built by transformToMaze. A map is stored as a .npy file
+    named by a sha256 of the walls, goals, window, granularity and the alien's shape geometry, and a hit is
+    memory-mapped copy-on-write, so it reaches the Maze constructor without reading or copying the file and
+    marking the start does not change it. When the files grow past max_bytes the least recently used ones
+    are deleted.
+    """
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, alien, goals, walls, window, granularity):
+        """Returns the hex digest naming the map of this floor plan, independent of the alien's configuration"""
+        probe = copy.deepcopy(alien)
+        geometry = []
+        for shape in probe.get_shapes():
+            probe.set_alien_config([0, 0, shape])
+            geometry.append([shape, alien_offsets(probe), probe.get_width()])
+        if isinstance(walls, SpatialIndex):
+            walls = walls.walls
+        if isinstance(goals, SpatialIndex):
+            goals = goals.goals
+        content = json.dumps([[list(wall) for wall in walls], [list(goal) for goal in goals], list(window),
+                              granularity, geometry], default=list)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".npy")
+
+    def load(self, key):
+        """Returns the cached map as a copy-on-write memmap, or None on a miss"""
+        path = self.path(key)
+        try:
+            maze_map = np.load(path, mmap_mode='c')
+        except (FileNotFoundError, ValueError):
+            return None
+        # the modification time doubles as the last use for eviction
+        os.utime(path)
+        return maze_map
+
+    def store(self, key, maze_map):
+        """Writes the map, evicts old maps over the size bound, and returns the map memory-mapped from disk"""
+        path = self.path(key)
+        # written under a temporary name and renamed, so a concurrent load never sees half a file
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary, "wb") as file:
+            np.save(file, maze_map)
+        os.replace(temporary, path)
+        self.evict(keep=path)
+        return np.load(path, mmap_mode='c')
+
+    def evict(self, keep=None):
+        """Deletes the least recently used maps until the cache fits in max_bytes, never deleting keep"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                path = os.path.join(self.directory, name)
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def map_tiles(rows, cols, side):
+    """Splits a rows x cols map into ((row_start, row_end), (col_start, col_end)) tiles of at most side x side"""
+    return [((row, min(row + side, rows)), (col, min(col + side, cols)))
+            for row in range(0, rows, side) for col in range(0, cols, side)]
+
+
+def fill_tile(tile, alien, goals, walls, window, granularity, xs, ys):
+    """Marks the walls and objectives of a (len(xs), len(ys), 3) block of the map, which starts out all spaces"""
+    offset = [0, 0, 0]
+    for shape_index in range(3):
+        alien.set_alien_config(idxToConfig((0, 0, shape_index), offset, granularity, alien))
+        not_within = ~is_alien_within_window_grid(alien, xs, ys, window, granularity)
+        touch_wall = does_alien_touch_wall_grid(alien, xs, ys, walls, granularity)
+        touch_goal = does_alien_touch_goal_grid(alien, xs, ys, goals)
+        layer = tile[:, :, shape_index]
+        layer[touch_goal] = OBJECTIVE_CHAR
+        layer[not_within | touch_wall] = WALL_CHAR
+
+
+def fill_tiles_parallel(alien, goals, walls, window, granularity, xs, ys, workers):
+    """Builds the map in square tiles on a process pool, every worker writing into one shared character array"""
+    rows, cols = len(xs), len(ys)
+    # about four tiles per worker, so uneven tiles still balance out
+    side = max(1, math.ceil(math.sqrt(rows * cols / (4 * workers))))
+    tiles = map_tiles(rows, cols, side)
+    dtype = np.dtype('<U1')
+    memory = shared_memory.SharedMemory(create=True, size=rows * cols * 3 * dtype.itemsize)
+    try:
+        shared = np.ndarray((rows, cols, 3), dtype=dtype, buffer=memory.buf)
+        shared[...] = SPACE_CHAR
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_tile_worker,
+                                 initargs=(memory.name, (rows, cols, 3), alien, goals, walls, window,
+                                           granularity, xs, ys)) as executor:
+            list(executor.map(_fill_shared_tile, tiles))
+        maze_map = shared.copy()
+        del shared
+    finally:
+        memory.close()
+        memory.unlink()
+    return maze_map
+
+
+# state of a tile worker process, set once by _init_tile_worker and only read by _fill_shared_tile
+_tile_worker = {}
+
+
+def _init_tile_worker(name, shape, alien, goals, walls, window, granularity, xs, ys):
+    memory = shared_memory.SharedMemory(name=name)
+    _tile_worker.update(memory=memory, shared=np.ndarray(shape, dtype='<U1', buffer=memory.buf), alien=alien,
+                        goals=goals, walls=walls, window=window, granularity=granularity, xs=xs, ys=ys)
+
+
+def _fill_shared_tile(tile):
+    (row_start, row_end), (col_start, col_end) = tile
+    state = _tile_worker
+    fill_tile(state["shared"][row_start:row_end, col_start:col_end], state["alien"], state["goals"],
+              state["walls"], state["window"], state["granularity"], state["xs"][row_start:row_end],
+              state["ys"][col_start:col_end])
+
+
+class LazyMaze:
+    """
+    Maze over the same configuration space as transformToMaze that classifies cells only when a search
+    first asks about them. The first query in a block of block x block centroids fills the whole block, for
+    all three shapes, with one vectorized fill_tile, and the result is memoized as one status byte per cell.
+    A search that finds a nearby goal therefore pays for the blocks it explored instead of the full map.
+    It answers getStart, getNeighbors, isValidMove and isObjective the way Maze does; getObjectives has to
+    classify every block, so astar builds its heuristic from getGoals instead.
+
+    A corridor, a boolean array over (row, column), confines the maze to the cells it marks: every other cell
+    is a wall for all shapes and is never classified, and getObjectives only classifies the blocks it covers.
+    """
+    UNKNOWN, FREE, WALL, OBJECTIVE = 0, 1, 2, 3
+
+    def __init__(self, alien, goals, walls, window, granularity, index=None, block=16, corridor=None):
+        self.alien = alien
+        # fill_tile moves the alien around, so it works on a copy and the caller's alien keeps its configuration
+        self.probe = copy.deepcopy(alien)
+        self.goals = goals if index is None else index
+        self.walls = walls if index is None else index
+        self.window = window
+        self.granularity = granularity
+        self.block = block
+        self.corridor = corridor
+        self.offsets = [0, 0, 0]
+        self.states_explored = 0
+        rows = int(window[0] / granularity + 1)
+        cols = int(window[1] / granularity + 1)
+        self.dimensions = [rows, cols, 3]
+        self.xs = [idxToConfig((row, 0, 0), self.offsets, granularity, alien)[0] for row in range(rows)]
+        self.ys = [idxToConfig((0, col, 0), self.offsets, granularity, alien)[1] for col in range(cols)]
+        self.status = np.zeros(self.dimensions, dtype=np.uint8)
+        self.start_index = tuple(configToIdx(alien.get_config(), self.offsets, granularity, alien))
+        self.start = idxToConfig(self.start_index, self.offsets, granularity, alien)
+        self.blocks_filled = 0
+
+    # helper classifies the block holding cell (x, y) for every shape, unless an earlier query already did
+    def fill_block(self, x, y):
+        if self.status[x, y, 0] != self.UNKNOWN:
+            return
+        row_start, col_start = x - x % self.block, y - y % self.block
+        row_end = min(row_start + self.block, self.dimensions[0])
+        col_end = min(col_start + self.block, self.dimensions[1])
+        tile = np.full((row_end - row_start, col_end - col_start, 3), SPACE_CHAR)
+        fill_tile(tile, self.probe, self.goals, self.walls, self.window, self.granularity,
+                  self.xs[row_start:row_end], self.ys[col_start:col_end])
+        status = np.full(tile.shape, self.FREE, dtype=np.uint8)
+        status[tile == WALL_CHAR] = self.WALL
+        status[tile == OBJECTIVE_CHAR] = self.OBJECTIVE
+        self.status[row_start:row_end, col_start:col_end] = status
+        if row_start <= self.start_index[0] < row_end and col_start <= self.start_index[1] < col_end:
+            self.status[self.start_index] = self.FREE
+        self.blocks_filled += 1
+
+    def classify(self, x, y, shape):
+        self.fill_block(x, y)
+        return self.status[x, y, shape]
+
+    def toIdx(self, x, y, shape, part1=False):
+        return (x, y, shape) if part1 else configToIdx((x, y, shape), self.offsets, self.granularity, self.alien)
+
+    def getStart(self):
+        return self.start
+
+    def getDimensions(self):
+        return self.dimensions
+
+    def isValidMove(self, x, y, shape, part1=False):
+        x, y, shape = self.toIdx(x, y, shape, part1)
+        return 0 <= x < self.dimensions[0] and 0 <= y < self.dimensions[1] and 0 <= shape < self.dimensions[2] \
+            and (self.corridor is None or self.corridor[x, y]) and self.classify(x, y, shape) != self.WALL
+
+    def isObjective(self, x, y, shape, part1=False):
+        x, y, shape = self.toIdx(x, y, shape, part1)
+        return self.classify(x, y, shape) == self.OBJECTIVE
+
+    def getNeighbors(self, x, y, shape, part1=False):
+        self.states_explored += 1
+        if part1:
+            candidates = [(x + 1, y, shape), (x - 1, y, shape), (x, y + 1, shape), (x, y - 1, shape),
+                          (x, y, shape + 1), (x, y, shape - 1)]
+        else:
+            step = self.granularity
+            shapes = self.alien.get_shapes()
+            shape_index = shapes.index(shape)
+            candidates = [(x + step, y, shape), (x - step, y, shape), (x, y + step, shape), (x, y - step, shape)]
+            candidates += [(x, y, shapes[index]) for index in (shape_index + 1, shape_index - 1)
+                           if 0 <= index < len(shapes)]
+        return [candidate for candidate in candidates if self.isValidMove(*candidate, part1)]
+
+    # the [(x, y, r)] goal circles the maze was built for, which unlike getObjectives classifies nothing
+    def getGoals(self):
+        return self.goals.goals if isinstance(self.goals, SpatialIndex) else list(self.goals)
+
+    def getObjectives(self):
+        for x in range(0, self.dimensions[0], self.block):
+            for y in range(0, self.dimensions[1], self.block):
+                if self.corridor is None or self.corridor[x:x + self.block, y:y + self.block].any():
+                    self.fill_block(x, y)
+        objectives = self.status == self.OBJECTIVE
+        if self.corridor is not None:
+            objectives &= self.corridor[:, :, None]
+        return [idxToConfig(index, self.offsets, self.granularity, self.alien) for index in zip(*np.nonzero(objectives))]
+
+
+def planCoarseToFine(alien, goals, walls, window, granularity, searchMethod="astar", factor=4, corridor=2, index=None):
+    """Plans at fine granularity by refining a path found at coarse granularity.
+
+        The map is first built and searched at factor times the granularity. The fine search then runs on a
+        LazyMaze confined to the cells within corridor coarse cells of the coarse path, so only that corridor
+        is ever classified at fine granularity. When the coarse search or the corridor finds no path, the
+        full map is built at fine granularity and searched instead. The path is valid at fine granularity but,
+        being confined to the corridor, not necessarily the shortest one.
+
+        Args:
+            alien (Alien): alien instance
+            goals (list): [(x, y, r)] of goals
+            walls (list): [(startx, starty, endx, endy)] of walls
+            window (tuple): (width, height) of the window
+            granularity (int): the fine granularity the path is returned at
+            searchMethod (str): search method of search(), "bfs" or "astar"
+            factor (int): coarse granularity as a multiple of granularity
+            corridor (int): half width of the corridor around the coarse path, in coarse cells
+            index (SpatialIndex): index over the walls and goals, used in their place
+
+        Return:
+            (path, maze): the path found at fine granularity, or None, and the maze it was searched on
+    """
+    begin_config = alien.get_config()
+    coarse_granularity = granularity * factor
+    coarse_path = None
+    if coarse_granularity < min(window):
+        coarse_maze = transformToMaze(alien, goals, walls, window, coarse_granularity, index=index)
+        coarse_path = search(coarse_maze, searchMethod)
+    if coarse_path:
+        rows = int(window[0] / granularity + 1)
+        cols = int(window[1] / granularity + 1)
+        mask = np.zeros((rows, cols), dtype=bool)
+        reach = corridor * coarse_granularity
+        for x, y, _ in coarse_path:
+            mask[max(0, math.floor((x - reach) / granularity)):math.ceil((x + reach) / granularity) + 1,
+                 max(0, math.floor((y - reach) / granularity)):math.ceil((y + reach) / granularity) + 1] = True
+        start = configToIdx(begin_config, [0, 0, 0], granularity, alien)
+        mask[start[0], start[1]] = True
+        maze = LazyMaze(alien, goals, walls, window, granularity, index=index, corridor=mask)
+        path = search(maze, searchMethod)
+        if path:
+            return path, maze
+    maze = transformToMaze(alien, goals, walls, window, granularity, index=index)
+    return search(maze, searchMethod), maze
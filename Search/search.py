@@ -24,197 +24,673 @@ files and classes when code is run, so be careful to not modify anything else.
 # Call compute_mst_weight to get the weight of the MST with those objectives
 # TODO: hint, you probably want to cache the MST value for sets of objectives you've already computed...
 
-from collections import deque
+from array import array
+from collections import deque, OrderedDict
 import heapq
+import json
+import time
+import numpy as np
+
+# distance stored in a distance field for cells a waypoint cannot reach
+UNREACHABLE = 2 ** 31 - 1
+
+
+class SearchStats:
+    """
+    Counters a search fills in when it is passed stats=SearchStats(). Searches only swap in the counting
+    push/append/heuristic wrappers below when stats are requested, so a run without stats executes the
+    same code it always did. Passing one object to several searches accumulates their counters.
+    """
+    def __init__(self):
+        self.expanded = 0
+        self.generated = 0
+        self.peak_frontier = 0
+        self.heap_pushes = 0
+        self.heuristic_calls = 0
+        self.heuristic_cache_hits = 0
+        self.setup_time = 0.0
+        self.expansion_time = 0.0
+        self.heuristic_time = 0.0
+        self.runs = 0
+        self._clock = 0.0
+        self._pushes = 0
+        self._heuristic_time = 0.0
+
+    # helper marks the start of a search, before the grid and heuristic are built
+    def begin(self):
+        self._clock = time.perf_counter()
+
+    # helper marks the end of the setup, right before the first node is expanded
+    def ready(self):
+        now = time.perf_counter()
+        self.setup_time += now - self._clock
+        self._clock = now
+        self._pushes = self.heap_pushes
+        self._heuristic_time = self.heuristic_time
+
+    # helper records the totals of a finished search; the time not spent in the heuristic counts as expansion
+    def finish(self, expanded, generated, heuristic_calls=0, cache=None):
+        self.runs += 1
+        self.expanded += expanded
+        self.generated += generated
+        self.heuristic_calls += heuristic_calls
+        if cache is not None:
+            self.heuristic_cache_hits += cache.hits
+        self.expansion_time += time.perf_counter() - self._clock - (self.heuristic_time - self._heuristic_time)
+
+    # heap pushes made since ready()
+    @property
+    def run_pushes(self):
+        return self.heap_pushes - self._pushes
+
+    def push(self, heap, item):
+        heapq.heappush(heap, item)
+        self.heap_pushes += 1
+        if len(heap) > self.peak_frontier:
+            self.peak_frontier = len(heap)
+
+    def appender(self, deck):
+        def append(item):
+            deck.append(item)
+            if len(deck) > self.peak_frontier:
+                self.peak_frontier = len(deck)
+        return append
+
+    def timed(self, heuristic):
+        def estimate(*args):
+            started = time.perf_counter()
+            value = heuristic(*args)
+            self.heuristic_time += time.perf_counter() - started
+            self.heuristic_calls += 1
+            return value
+        return estimate
+
+    def as_dict(self):
+        return {
+            "runs": self.runs,
+            "expanded": self.expanded,
+            "generated": self.generated,
+            "peak_frontier": self.peak_frontier,
+            "heap_pushes": self.heap_pushes,
+            "heuristic_calls": self.heuristic_calls,
+            "heuristic_cache_hits": self.heuristic_cache_hits,
+            "setup_time": self.setup_time,
+            "expansion_time": self.expansion_time,
+            "heuristic_time": self.heuristic_time,
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
 
 
 class MST:
-    def __init__(self, objectives):
-        self.elements = {key: None for key in objectives}
+    def __init__(self, objectives, distances):
+        self.elements = list(objectives)
 
-        # TODO: implement some distance between two objectives
-        # ... either compute the shortest path between them, or just use the manhattan distance between the objectives
-        self.distances = {
-                (i, j): manhattan_distance(i, j)
-                for i, j in self.cross(objectives)
-            }
+        # distances is a dense matrix of true maze distances indexed by objective
+        self.distances = distances
 
-    # Prim's algorithm adds edges to the MST in sorted order as long as they don't create a cycle
+    # Prim's algorithm grows the tree from the first objective, always attaching the closest outside objective
     def compute_mst_weight(self):
+        if not self.elements:
+            return 0
         weight = 0
-        for distance, i, j in sorted((self.distances[(i, j)], i, j) for (i, j) in self.distances):
-            if self.unify(i, j):
-                weight += distance
+        root = self.elements[0]
+        closest = {key: self.distances[root][key] for key in self.elements[1:]}
+        while closest:
+            key = min(closest, key=closest.get)
+            weight += closest.pop(key)
+            row = self.distances[key]
+            for other in closest:
+                if row[other] < closest[other]:
+                    closest[other] = row[other]
         return weight
 
-    # helper checks the root of a node, in the process flatten the path to the root
-    def resolve(self, key):
-        path = []
-        root = key
-        while self.elements[root] is not None:
-            path.append(root)
-            root = self.elements[root]
-        for key in path:
-            self.elements[key] = root
-        return root
-
-    # helper checks if the two elements have the same root they are part of the same tree
-    # otherwise set the root of one to the other, connecting the trees
-    def unify(self, a, b):
-        ra = self.resolve(a)
-        rb = self.resolve(b)
-        if ra == rb:
-            return False
-        else:
-            self.elements[rb] = ra
-            return True
-
-    # helper that gets all pairs i,j for a list of keys
-    def cross(self, keys):
-        return (x for y in (((i, j) for j in keys if i < j) for i in keys) for x in y)
 
-
-def bfs(maze):
+class MSTCache:
+    def __init__(self, distances, maxsize=1 << 16):
+        self.distances = distances
+        self.maxsize = maxsize
+        self.weights = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # helper returns the MST weight of the waypoints in the mask, evicting the least recently used subset when full
+    def weight(self, mask):
+        weights = self.weights
+        if mask in weights:
+            self.hits += 1
+            weights.move_to_end(mask)
+            return weights[mask]
+        self.misses += 1
+        value = MST([bit for bit in range(len(self.distances)) if mask >> bit & 1], self.distances).compute_mst_weight()
+        weights[mask] = value
+        if len(weights) > self.maxsize:
+            weights.popitem(last=False)
+        return value
+
+
+class Grid:
+    def __init__(self, maze):
+        self.height = maze.size.y
+        self.width = maze.size.x
+        self.size = self.height * self.width
+
+        # occupancy is True for navigable cells. The fast path depends on the staff Maze's internal layout,
+        # not its public interface: it keeps its rows as strings in the private, name-mangled __storage, which
+        # are compared with the wall character in one pass. Should that attribute be renamed, and for any other
+        # maze, navigable is asked one cell at a time instead, which gives the same occupancy more slowly.
+        rows = getattr(maze, '_Maze__storage', None)
+        legend = getattr(maze, 'legend', None)
+        if rows is not None and legend is not None:
+            self.occupancy = np.array(rows).view('U1').reshape(self.height, self.width) != legend.wall
+        else:
+            self.occupancy = np.array([[maze.navigable(i, j) for j in range(self.width)]
+                                       for i in range(self.height)], dtype=bool)
+
+        # CSR neighbor table: the neighbors of cell c are targets[offsets[c]:offsets[c + 1]], listed in the
+        # same order as maze.neighbors so ties break identically
+        valid = np.zeros((self.height, self.width, 4), dtype=bool)
+        valid[:-1, :, 0] = self.occupancy[1:, :]
+        valid[1:, :, 1] = self.occupancy[:-1, :]
+        valid[:, :-1, 2] = self.occupancy[:, 1:]
+        valid[:, 1:, 3] = self.occupancy[:, :-1]
+        # walls have no moves out of them, so a search or field started on a wall reaches nothing
+        valid &= self.occupancy[:, :, None]
+        cells = np.arange(self.size).reshape(self.height, self.width, 1)
+        targets = (cells + np.array([self.width, -self.width, 1, -1]))[valid]
+        offsets = np.concatenate(([0], np.cumsum(valid.sum(axis=2).ravel())))
+        self.targets = array('i', targets.astype(np.int32).tobytes())
+        self.offsets = array('i', offsets.astype(np.int32).tobytes())
+
+    def cell(self, position):
+        return position[0] * self.width + position[1]
+
+    def position(self, cell):
+        return divmod(cell, self.width)
+
+    def neighbors(self, cell):
+        return self.targets[self.offsets[cell]:self.offsets[cell + 1]]
+
+    # helper walks a parent buffer back from cell and returns the path as (row, col) tuples
+    def path(self, parent, cell):
+        path = deque()
+        while cell != -1:
+            path.appendleft(divmod(cell, self.width))
+            cell = parent[cell]
+        return list(path)
+
+    def distance_field(self, source):
+        """
+        Runs BFS from the source cell and returns the maze distance to every cell, indexed by flat cell index.
+        Cells that cannot be reached hold UNREACHABLE.
+        """
+        targets, offsets = self.targets, self.offsets
+        field = array('i', [UNREACHABLE]) * self.size
+        field[source] = 0
+        deck = deque([source])
+        while deck:
+            node = deck.popleft()
+            step = field[node] + 1
+            for neighbor in targets[offsets[node]:offsets[node + 1]]:
+                if field[neighbor] == UNREACHABLE:
+                    field[neighbor] = step
+                    deck.append(neighbor)
+        return field
+
+
+class Heuristic:
+    def __init__(self, grid, waypoints, cache_size=1 << 16):
+        cells = [grid.cell(waypoint) for waypoint in waypoints]
+        self.fields = [grid.distance_field(cell) for cell in cells]
+        self.distances = [[field[cell] for cell in cells] for field in self.fields]
+        self.cache = MSTCache(self.distances, cache_size)
+
+    # true maze distance to the closest remaining waypoint plus the MST weight of the remaining waypoints
+    def __call__(self, cell, mask):
+        if not mask:
+            return 0
+        fields = self.fields
+        closest = min(fields[bit][cell] for bit in range(len(fields)) if mask >> bit & 1)
+        return closest + self.cache.weight(mask)
+
+
+class MazeRouter:
+    def __init__(self, maze, max_bytes=256 << 20, grid=None):
+        self.grid = Grid(maze) if grid is None else grid
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.fields = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    # helper returns the cached (distance, parent) fields of a BFS from source, computing and caching them on a miss
+    def field(self, source):
+        fields = self.fields
+        if source in fields:
+            self.hits += 1
+            fields.move_to_end(source)
+            return fields[source]
+        self.misses += 1
+        targets, offsets = self.grid.targets, self.grid.offsets
+        distance = array('i', [UNREACHABLE]) * self.grid.size
+        parent = array('i', [-1]) * self.grid.size
+        distance[source] = 0
+        deck = deque([source])
+        while deck:
+            node = deck.popleft()
+            step = distance[node] + 1
+            for neighbor in targets[offsets[node]:offsets[node + 1]]:
+                if distance[neighbor] == UNREACHABLE:
+                    distance[neighbor] = step
+                    parent[neighbor] = node
+                    deck.append(neighbor)
+        fields[source] = distance, parent
+        self.nbytes += (len(distance) + len(parent)) * distance.itemsize
+        # evict the least recently used fields until the cache fits, always keeping the one just computed
+        while self.nbytes > self.max_bytes and len(fields) > 1:
+            evicted_distance, evicted_parent = fields.popitem(last=False)[1]
+            self.nbytes -= (len(evicted_distance) + len(evicted_parent)) * evicted_distance.itemsize
+        return distance, parent
+
+    def distance(self, start, goal):
+        """
+        Returns the number of steps on a shortest path from start to goal, or None if goal cannot be reached.
+        """
+        distance = self.field(self.grid.cell(start))[0][self.grid.cell(goal)]
+        return None if distance == UNREACHABLE else distance
+
+    def route(self, start, goal):
+        """
+        Returns a shortest path from start to goal as (row, col) tuples, or [] if goal cannot be reached.
+        A field cached for the goal is reused by walking it from the start, since moves are reversible.
+        """
+        grid = self.grid
+        start_cell, goal_cell = grid.cell(start), grid.cell(goal)
+        if goal_cell in self.fields and start_cell not in self.fields:
+            distance, parent = self.field(goal_cell)
+            if distance[start_cell] == UNREACHABLE:
+                return []
+            return grid.path(parent, start_cell)[::-1]
+        distance, parent = self.field(start_cell)
+        if distance[goal_cell] == UNREACHABLE:
+            return []
+        return grid.path(parent, goal_cell)
+
+    def route_many(self, queries):
+        """
+        Answers a batch of (start, goal) queries, grouping them by start so every source is searched at most
+        once while its field is in use. The paths are returned in the order of the queries.
+        """
+        grouped = OrderedDict()
+        for index, (start, goal) in enumerate(queries):
+            grouped.setdefault(start, []).append((index, goal))
+        paths = [None] * sum(len(group) for group in grouped.values())
+        for start, group in grouped.items():
+            for index, goal in group:
+                paths[index] = self.route(start, goal)
+        return paths
+
+
+def bfs(maze, stats=None, grid=None):
     """
     Runs BFS for part 1 of the assignment.
 
     @param maze: The maze to execute the search on.
+    @param stats: optional SearchStats to fill in
+    @param grid: optional prebuilt Grid of the maze, shared by searches on the same maze
 
     @return path: a list of tuples containing the coordinates of each state in the computed path
     """
-    deck = deque()
-    deck.append(maze.start)
-    visited = set()
-    route = {maze.start: None}
-    path = deque()
-    loop = True
-    while loop:
+    if stats is not None:
+        stats.begin()
+    grid = Grid(maze) if grid is None else grid
+    targets, offsets = grid.targets, grid.offsets
+    start = grid.cell(maze.start)
+    goal = grid.cell(maze.waypoints[0])
+    visited = bytearray(grid.size)
+    parent = array('i', [-1]) * grid.size
+    visited[start] = 1
+    deck = deque([start])
+    append = deck.append
+    if stats is not None:
+        append = stats.appender(deck)
+        stats.ready()
+    expanded = 0
+    while deck and not visited[goal]:
         node = deck.popleft()
-        visited.add(node)
-        for neighbor in maze.neighbors(node[0], node[1]):
-            if neighbor not in visited:
-                deck.append(neighbor)
-                visited.add(neighbor)
-                route[neighbor] = node
-                if neighbor == maze.waypoints[0]:
-                    path.appendleft(neighbor)
-                    backtracking = route[neighbor]
-                    while backtracking in route:
-                        path.appendleft(backtracking)
-                        backtracking = route[backtracking]
-                    loop = False
-    return path
+        expanded += 1
+        for neighbor in targets[offsets[node]:offsets[node + 1]]:
+            if not visited[neighbor]:
+                append(neighbor)
+                visited[neighbor] = 1
+                parent[neighbor] = node
+    maze.states_explored += expanded
+    if stats is not None:
+        stats.finish(expanded, visited.count(1) - 1)
+    return grid.path(parent, goal) if visited[goal] else []
 
 
 def manhattan_distance(coordinate_a, coordinate_b):
     return abs(coordinate_a[1] - coordinate_b[1]) + abs(coordinate_a[0] - coordinate_b[0])
 
 
-def astar_single(maze):
+def astar_single(maze, stats=None, grid=None):
     """
     Runs A star for part 2 of the assignment.
 
     @param maze: The maze to execute the search on.
+    @param stats: optional SearchStats to fill in
+    @param grid: optional prebuilt Grid of the maze, shared by searches on the same maze
 
     @return path: a list of tuples containing the coordinates of each state in the computed path
     """
-    distance = {maze.start: 0}
-    deck = []
-    heapq.heappush(deck, (distance[maze.start] + manhattan_distance(maze.start, maze.waypoints[0]), maze.start))
-    visited = set()
-    route = {maze.start: None}
-    path = deque()
-    loop = True
-    while loop:
+    if stats is not None:
+        stats.begin()
+    grid = Grid(maze) if grid is None else grid
+    targets, offsets, width = grid.targets, grid.offsets, grid.width
+    start = grid.cell(maze.start)
+    goal_row, goal_col = maze.waypoints[0]
+    goal = grid.cell(maze.waypoints[0])
+    parent = array('i', [-1]) * grid.size
+    distance = array('i', [UNREACHABLE]) * grid.size
+    closed = bytearray(grid.size)
+    distance[start] = 0
+    deck = [(manhattan_distance(maze.start, maze.waypoints[0]), start)]
+    push = heapq.heappush
+    if stats is not None:
+        push = stats.push
+        stats.ready()
+    expanded = 0
+    while deck:
         node = heapq.heappop(deck)[1]
-        visited.add(node)
-        for neighbor in maze.neighbors(node[0], node[1]):
-            if neighbor not in visited:
-                distance[neighbor] = distance[node] + 1
-                visited.add(neighbor)
-                route[neighbor] = node
-                heapq.heappush(deck, (distance[neighbor] + manhattan_distance(neighbor, maze.waypoints[0]), neighbor))
-                if neighbor == maze.waypoints[0]:
-                    path.appendleft(neighbor)
-                    backtracking = route[neighbor]
-                    while backtracking in route:
-                        path.appendleft(backtracking)
-                        backtracking = route[backtracking]
-                    loop = False
-    return path
+        if closed[node]:
+            continue
+        closed[node] = 1
+        expanded += 1
+        if node == goal:
+            break
+        neighbor_distance = distance[node] + 1
+        for neighbor in targets[offsets[node]:offsets[node + 1]]:
+            if neighbor_distance < distance[neighbor]:
+                parent[neighbor] = node
+                distance[neighbor] = neighbor_distance
+                row, col = divmod(neighbor, width)
+                push(deck, (neighbor_distance + abs(col - goal_col) + abs(row - goal_row), neighbor))
+    maze.states_explored += expanded
+    if stats is not None:
+        # the Manhattan heuristic is inlined, evaluated once for the start and once per push
+        stats.finish(expanded, len(distance) - distance.count(UNREACHABLE) - 1, heuristic_calls=stats.run_pushes + 1)
+    return grid.path(parent, goal) if closed[goal] else []
+
+
+def jps(maze, stats=None, grid=None):
+    """
+    Runs Jump Point Search on a 4-connected grid. Only jump points are pushed on the heap, and the straight
+    segments between them are filled back in so the path is as short as the one bfs finds.
 
+    @param maze: The maze to execute the search on.
+    @param stats: optional SearchStats to fill in
+    @param grid: optional prebuilt Grid of the maze, shared by searches on the same maze
 
-def astar_or_fast(maze, weight):
-    weight_dictionary = {}
-    state = (maze.start, maze.waypoints)
-    state_weight_dictionary = heuristic(state[0], state[1], weight_dictionary)
-    distance = {state: 0}
-    weight_dictionary = state_weight_dictionary[1]
-    deck = []
-    heapq.heappush(deck, (state_weight_dictionary[0] * weight, state))
-    visited = set()
-    route = {state: None}
-    path = deque()
-    loop = True
-    while loop:
-        node_state = heapq.heappop(deck)[1]
-        node = node_state[0]
-        node_visited = node_state[1]
-        visited.add(node_state)
-        if len(node_visited) == 1 and node in node_visited:
-            path.appendleft(node_state[0])
-            backtracking = route[node_state]
-            while backtracking in route:
-                path.appendleft(backtracking[0])
-                backtracking = route[backtracking]
+    @return path: a list of tuples containing the coordinates of each state in the computed path
+    """
+    if stats is not None:
+        stats.begin()
+    grid = Grid(maze) if grid is None else grid
+    # pad the occupancy with a wall border so the scans below never need a bounds check
+    stride = grid.width + 2
+    padded = np.pad(grid.occupancy, 1).ravel()
+    is_open = bytearray(padded.astype(np.uint8).tobytes())
+    goal_row, goal_col = maze.waypoints[0]
+    goal = (goal_row + 1) * stride + goal_col + 1
+
+    # Horizontal jumps are precomputed for the whole grid: scanning a row stops at the first wall, the goal
+    # or a cell with a forced neighbor, so jump[step][cell] is that stopping cell, or -1 for a wall.
+    cells = np.arange(len(padded))
+    jump = {}
+    for step in (1, -1):
+        forced = (np.roll(padded, stride) & ~np.roll(padded, stride + step)) | \
+                 (np.roll(padded, -stride) & ~np.roll(padded, -stride + step))
+        stops = ~padded | forced
+        stops[goal] = True
+        stops = np.flatnonzero(stops)
+        if step == 1:
+            stop = stops[np.minimum(np.searchsorted(stops, cells, side='right'), len(stops) - 1)]
+        else:
+            stop = stops[np.maximum(np.searchsorted(stops, cells, side='left') - 1, 0)]
+        jump[step] = array('i', np.where(padded[stop], stop, -1).astype(np.int32).tobytes())
+    jump_right, jump_left = jump[1], jump[-1]
+
+    # helper scans along a column, also stopping where a horizontal scan would find a jump point
+    def jump_vertical(cell, step):
+        while True:
+            cell += step
+            if not is_open[cell]:
+                return -1
+            if cell == goal or (is_open[cell - 1] and not is_open[cell - 1 - step]) or \
+                    (is_open[cell + 1] and not is_open[cell + 1 - step]):
+                return cell
+            if jump_right[cell] != -1 or jump_left[cell] != -1:
+                return cell
+
+    start = (maze.start[0] + 1) * stride + maze.start[1] + 1
+    parent = array('i', [-1]) * len(is_open)
+    distance = array('i', [UNREACHABLE]) * len(is_open)
+    closed = bytearray(len(is_open))
+    distance[start] = 0
+    deck = [(manhattan_distance(maze.start, maze.waypoints[0]), start)]
+    push = heapq.heappush
+    if stats is not None:
+        push = stats.push
+        stats.ready()
+    expanded = 0
+    while deck:
+        node = heapq.heappop(deck)[1]
+        if closed[node]:
+            continue
+        closed[node] = 1
+        expanded += 1
+        if node == goal:
             break
-        if node in node_visited:
-            neighbor_visited = node_visited[:node_visited.index(node)] + node_visited[node_visited.index(node) + 1:]
+        row, col = divmod(node, stride)
+        if parent[node] == -1:
+            directions = (stride, -stride, 1, -1)
+        elif parent[node] // stride == row:
+            directions = (stride, -stride, 1 if node > parent[node] else -1)
         else:
-            neighbor_visited = node_visited
-        for neighbor in maze.neighbors(node[0], node[1]):
-            neighbor_distance = distance[node_state] + 1
-            if (neighbor, neighbor_visited) not in visited:
-                visited.add((neighbor, neighbor_visited))
-                distance[(neighbor, neighbor_visited)] = neighbor_distance
-                next_weight = heuristic(neighbor, neighbor_visited, weight_dictionary)
-                weight_dictionary = next_weight[1]
-                heapq.heappush(deck, (neighbor_distance + next_weight[0] * weight, (neighbor, neighbor_visited)))
-                route[(neighbor, neighbor_visited)] = (node, node_visited)
-    return path
-
-
-def astar_multiple(maze):
+            directions = (1, -1, stride if node > parent[node] else -stride)
+        for step in directions:
+            if step == 1 or step == -1:
+                jump_point = jump[step][node]
+            else:
+                jump_point = jump_vertical(node, step)
+            if jump_point == -1 or closed[jump_point]:
+                continue
+            jump_row, jump_col = divmod(jump_point, stride)
+            jump_distance = distance[node] + abs(jump_row - row) + abs(jump_col - col)
+            if jump_distance < distance[jump_point]:
+                distance[jump_point] = jump_distance
+                parent[jump_point] = node
+                push(deck, (jump_distance + abs(jump_col - 1 - goal_col) + abs(jump_row - 1 - goal_row), jump_point))
+    maze.states_explored += expanded
+    if stats is not None:
+        # the Manhattan heuristic is inlined, evaluated once for the start and once per push
+        stats.finish(expanded, len(distance) - distance.count(UNREACHABLE) - 1, heuristic_calls=stats.run_pushes + 1)
+    if not closed[goal]:
+        return []
+
+    # fill in the straight segments between consecutive jump points
+    path = deque([(goal_row, goal_col)])
+    node = goal
+    while parent[node] != -1:
+        jump_point = parent[node]
+        step = (1 if jump_point > node else -1) * (1 if abs(jump_point - node) < stride else stride)
+        while node != jump_point:
+            node += step
+            path.appendleft((node // stride - 1, node % stride - 1))
+    return list(path)
+
+
+def astar_multiple(maze, stats=None, grid=None):
     """
     Runs A star for part 3 of the assignment in the case where there are
     multiple objectives.
 
     @param maze: The maze to execute the search on.
+    @param stats: optional SearchStats to fill in
+    @param grid: optional prebuilt Grid of the maze, shared by searches on the same maze
 
     @return path: a list of tuples containing the coordinates of each state in the computed path
     """
-    return astar_or_fast(maze, 1)
-
+    # a single pass at weight 1 is plain A*, and the heuristic is consistent, so its one path is optimal
+    search = anytime_astar(maze, weights=(1,), stats=stats, grid=grid)
+    path = next(search, ([], 1.0))[0]
+    search.close()
+    return path
 
-def heuristic(current_position, waypoints, weight_dictionary):
-    distance = []
-    for waypoint in waypoints:
-        distance.append(manhattan_distance(current_position, waypoint))
-    distance = min(distance)
-    if waypoints in weight_dictionary:
-        distance += weight_dictionary[waypoints]
-    else:
-        distance += MST(waypoints).compute_mst_weight()
-        weight_dictionary[waypoints] = MST(waypoints).compute_mst_weight()
-    return distance, weight_dictionary
 
+def anytime_astar(maze, weights=(10, 5, 3, 2, 1.5, 1.2, 1), time_budget=None, node_budget=None, stats=None,
+                  grid=None):
+    """
+    Runs anytime repairing A* (ARA*) over the multi-waypoint state space. The first pass uses the largest
+    weight; every later pass lowers the weight and resumes from the open list plus the states whose cost
+    improved after they were closed, instead of searching from scratch.
 
-def fast(maze):
+    @param maze: The maze to execute the search on.
+    @param weights: decreasing heuristic weights, one per pass
+    @param time_budget: seconds the passes may run in total, counted from the start of the first pass and
+                        including the time it takes to find the first path, or None for no limit; the first
+                        pass is never cut short before it finds a path
+    @param node_budget: states to expand in total, including the pass that finds the first path, or None for
+                        no limit; the first pass is never cut short before it finds a path
+    @param stats: optional SearchStats to fill in
+    @param grid: optional prebuilt Grid of the maze, shared by searches on the same maze
+
+    @return generator of (path, bound) pairs, one per finished pass and one more if a budget cuts a pass short
+            after it found a shorter path; each path is the best so far and is proven to be at most bound
+            times longer than the optimal path
+    """
+    if stats is not None:
+        stats.begin()
+    grid = Grid(maze) if grid is None else grid
+    targets, offsets = grid.targets, grid.offsets
+    bits = len(maze.waypoints)
+    full = (1 << bits) - 1
+    waypoint_bits = {grid.cell(waypoint): 1 << bit for bit, waypoint in enumerate(maze.waypoints)}
+    estimate = cache = Heuristic(grid, maze.waypoints)
+    push = heapq.heappush
+    if stats is not None:
+        cache = estimate.cache
+        estimate = stats.timed(estimate)
+        push = stats.push
+        stats.ready()
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+
+    # A state packs the flat cell index of the position above a bitmask of the waypoints that are still to be
+    # visited, so every lookup is keyed by one int. A waypoint is removed from the mask as soon as it is stepped
+    # on, so goal states have an empty mask.
+    start_cell = grid.cell(maze.start)
+    start = start_cell << bits | full & ~waypoint_bits.get(start_cell, 0)
+    distance = {start: 0}
+    route = {start: None}
+    closed = set()
+    inconsistent = set()
+    goal, goal_distance = (start, 0) if start & full == 0 else (None, UNREACHABLE)
+    queued = {start: None} if goal is None else {}
+    expanded = 0
+
+    # helper reconstructs the path ending in a state
+    def backtrack(state):
+        path = deque()
+        while state is not None:
+            path.appendleft(grid.position(state >> bits))
+            state = route[state]
+        return list(path)
+
+    # helper bounds the suboptimality of the current goal by the smallest unweighted f-value left to explore
+    def bound(weight):
+        pending = [distance[state] + estimate(state >> bits, state & full) for state in queued]
+        pending.extend(distance[state] + estimate(state >> bits, state & full) for state in inconsistent)
+        if not pending:
+            return 1.0
+        return max(1.0, min(weight, goal_distance / max(min(pending), 1)))
+
+    try:
+        for weight in weights:
+            # re-key the open list and the inconsistent states under the new weight
+            for state in inconsistent:
+                queued[state] = None
+            inconsistent = set()
+            closed = set()
+            for state in queued:
+                queued[state] = distance[state] + weight * estimate(state >> bits, state & full)
+            deck = [(key, state) for state, key in queued.items()]
+            heapq.heapify(deck)
+            improved = False
+
+            while deck and deck[0][0] < goal_distance:
+                key, state = heapq.heappop(deck)
+                if queued.get(state) != key:
+                    continue
+                del queued[state]
+                if goal is not None and ((deadline is not None and time.perf_counter() > deadline) or
+                                         (node_budget is not None and expanded >= node_budget)):
+                    queued[state] = key
+                    if improved:
+                        yield backtrack(goal), bound(float('inf'))
+                    return
+                closed.add(state)
+                expanded += 1
+                mask = state & full
+                neighbor_distance = distance[state] + 1
+                cell = state >> bits
+                for neighbor_cell in targets[offsets[cell]:offsets[cell + 1]]:
+                    neighbor_mask = mask & ~waypoint_bits.get(neighbor_cell, 0)
+                    neighbor = neighbor_cell << bits | neighbor_mask
+                    if neighbor_distance < distance.get(neighbor, UNREACHABLE):
+                        distance[neighbor] = neighbor_distance
+                        route[neighbor] = state
+                        if not neighbor_mask:
+                            if neighbor_distance < goal_distance:
+                                goal, goal_distance = neighbor, neighbor_distance
+                                improved = True
+                        elif neighbor in closed:
+                            inconsistent.add(neighbor)
+                        else:
+                            neighbor_key = neighbor_distance + weight * estimate(neighbor_cell, neighbor_mask)
+                            queued[neighbor] = neighbor_key
+                            push(deck, (neighbor_key, neighbor))
+
+            if goal is None:
+                break
+            current_bound = bound(weight)
+            yield backtrack(goal), current_bound
+            if current_bound == 1.0:
+                break
+    finally:
+        maze.states_explored += expanded
+        if stats is not None:
+            stats.finish(expanded, len(distance) - 1, cache=cache)
+
+
+def fast(maze, time_budget=None, node_budget=None, stats=None, grid=None):
     """
     Runs suboptimal search algorithm for part 4.
 
     @param maze: The maze to execute the search on.
+    @param time_budget: seconds the whole search may run, including finding the first path, which is
+                        returned even if it takes longer
+    @param node_budget: states anytime_astar may expand in total, including those needed for the first path
+    @param stats: optional SearchStats to fill in
+    @param grid: optional prebuilt Grid of the maze, shared by searches on the same maze
 
     @return path: a list of tuples containing the coordinates of each state in the computed path
     """
-    return astar_or_fast(maze, 10)
+    path = []
+    search = anytime_astar(maze, time_budget=time_budget, node_budget=node_budget, stats=stats, grid=grid)
+    for path, bound in search:
+        if time_budget is None and node_budget is None:
+            break
+    search.close()
+    return path
@@ -0,0 +1,295 @@
+# benchmark.py
+# ---------------
+# Reproducible benchmarks for the search methods of MP1 (Search/search.py) and MP2 (Robotics/search.py).
+# Mazes are generated from a seed, so no map files are needed and everything runs offline.
+#
+# Usage:
+#   python benchmark.py --save baseline.json
+#   python benchmark.py --baseline baseline.json
+
+"""
+Runs bfs, astar_single, jps, astar_multiple and fast from MP1 and the 3-D bfs and astar from MP2 on seeded synthetic
+mazes, and records time, peak memory (tracemalloc), nodes expanded and path length for each of them.
+Results can be saved as a JSON baseline and later compared against it.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import types
+from collections import deque
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class GridMaze:
+    """
+    Synthetic stand-in for the MP1 Maze: the same start, waypoints, size, navigable, neighbors and
+    states_explored interface, built from rows of '%' walls, 'P' start and '.' waypoints.
+    """
+    def __init__(self, rows):
+        self.size = types.SimpleNamespace(x=len(rows[0]), y=len(rows))
+        self._storage = rows
+        cells = [(i, j) for i in range(self.size.y) for j in range(self.size.x)]
+        self.start = next(cell for cell in cells if rows[cell[0]][cell[1]] == 'P')
+        self.waypoints = tuple(cell for cell in cells if rows[cell[0]][cell[1]] == '.')
+        self.states_explored = 0
+
+    def __getitem__(self, index):
+        i, j = index
+        if 0 <= i < self.size.y and 0 <= j < self.size.x:
+            return self._storage[i][j]
+        raise IndexError(index)
+
+    def navigable(self, i, j):
+        try:
+            return self[i, j] != '%'
+        except IndexError:
+            return False
+
+    def neighbors(self, i, j):
+        self.states_explored += 1
+        return tuple(x for x in ((i + 1, j), (i - 1, j), (i, j + 1), (i, j - 1)) if self.navigable(*x))
+
+
+class ConfigMaze:
+    """
+    Synthetic stand-in for the MP2 Maze over (row, col, shape) indices, answering the ispart1=True calls
+    of getStart, getNeighbors and isObjective that the Robotics searches make. With granularity 1, no
+    offsets and shapes named by their index, configurations and indices coincide.
+    """
+    def __init__(self, walls, objectives, start):
+        self.walls = walls
+        self.objectives = objectives
+        self.start = start
+        self.dimensions = (len(walls), len(walls[0]), len(walls[0][0]))
+        self.granularity = 1
+        self.offsets = [0, 0, 0]
+        self.alien = types.SimpleNamespace(get_shapes=lambda: list(range(self.dimensions[2])))
+        self.states_explored = 0
+
+    def getStart(self):
+        return self.start
+
+    def getObjectives(self):
+        return sorted(self.objectives)
+
+    def isObjective(self, x, y, shape, part1=False):
+        return (x, y, shape) in self.objectives
+
+    def getNeighbors(self, x, y, shape, part1=False):
+        self.states_explored += 1
+        rows, cols, shapes = self.dimensions
+        return [(i, j, k) for i, j, k in ((x + 1, y, shape), (x - 1, y, shape), (x, y + 1, shape), (x, y - 1, shape),
+                                          (x, y, shape + 1), (x, y, shape - 1))
+                if 0 <= i < rows and 0 <= j < cols and 0 <= k < shapes and not self.walls[i][j][k]]
+
+
+# helper keeps the largest connected open region, so every generated start and goal can reach each other
+def largest_region(is_open, neighbors, cells):
+    seen = set()
+    best = []
+    for cell in cells:
+        if cell in seen or not is_open(cell):
+            continue
+        region = [cell]
+        seen.add(cell)
+        deck = deque([cell])
+        while deck:
+            for neighbor in neighbors(deck.popleft()):
+                if neighbor not in seen and is_open(neighbor):
+                    seen.add(neighbor)
+                    region.append(neighbor)
+                    deck.append(neighbor)
+        if len(region) > len(best):
+            best = region
+    return best
+
+
+def generate_maze(height, width, density, waypoints, seed):
+    """
+    Returns a GridMaze with a wall border, interior walls placed with the given density, a start and the
+    given number of waypoints, all drawn from the largest connected region.
+    """
+    rng = random.Random(seed)
+    grid = [['%' if i in (0, height - 1) or j in (0, width - 1) or rng.random() < density else ' '
+             for j in range(width)] for i in range(height)]
+    region = largest_region(lambda cell: grid[cell[0]][cell[1]] == ' ',
+                            lambda cell: ((cell[0] + 1, cell[1]), (cell[0] - 1, cell[1]),
+                                          (cell[0], cell[1] + 1), (cell[0], cell[1] - 1)),
+                            ((i, j) for i in range(height) for j in range(width)))
+    if len(region) <= waypoints:
+        raise ValueError("density {} leaves too few open cells for {} waypoints".format(density, waypoints))
+    chosen = rng.sample(region, waypoints + 1)
+    grid[chosen[0][0]][chosen[0][1]] = 'P'
+    for i, j in chosen[1:]:
+        grid[i][j] = '.'
+    return GridMaze([''.join(row) for row in grid])
+
+
+def generate_config_maze(height, width, density, goals, seed, shapes=3):
+    """
+    Returns a ConfigMaze of shape (height, width, shapes) with walls placed with the given density and
+    a start and goal cells drawn from the largest connected region.
+    """
+    rng = random.Random(seed)
+    walls = [[[rng.random() < density for _ in range(shapes)] for _ in range(width)] for _ in range(height)]
+    dimensions = (height, width, shapes)
+    region = largest_region(lambda cell: not walls[cell[0]][cell[1]][cell[2]],
+                            lambda cell: [(i, j, k) for i, j, k in (
+                                (cell[0] + 1, cell[1], cell[2]), (cell[0] - 1, cell[1], cell[2]),
+                                (cell[0], cell[1] + 1, cell[2]), (cell[0], cell[1] - 1, cell[2]),
+                                (cell[0], cell[1], cell[2] + 1), (cell[0], cell[1], cell[2] - 1))
+                                if 0 <= i < dimensions[0] and 0 <= j < dimensions[1] and 0 <= k < dimensions[2]],
+                            ((i, j, k) for i in range(height) for j in range(width) for k in range(shapes)))
+    chosen = rng.sample(region, goals + 1)
+    return ConfigMaze(walls, set(chosen[1:]), chosen[0])
+
+
+def measure(run, make_maze, repeat):
+    """
+    Times run on fresh mazes and returns the best time, the peak traced memory of one extra traced run,
+    the nodes expanded and the path length.
+    """
+    best = None
+    for _ in range(repeat):
+        maze = make_maze()
+        started = time.perf_counter()
+        path, stats = run(maze)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    maze = make_maze()
+    tracemalloc.start()
+    run(maze)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "time": best,
+        "peak_memory": peak,
+        "expanded": stats.expanded,
+        "path_length": len(path) if path else 0,
+    }
+
+
+def run_benchmarks(args):
+    mp1 = load_module("mp1_search", os.path.join("Search", "search.py"))
+    mp2 = load_module("mp2_search", os.path.join("Robotics", "search.py"))
+
+    def single():
+        return generate_maze(args.size, args.size, args.density, 1, args.seed)
+
+    def multiple():
+        return generate_maze(args.size // 2, args.size // 2, args.density, args.waypoints, args.seed)
+
+    def config():
+        return generate_config_maze(args.size // 2, args.size // 2, args.density, 1, args.seed)
+
+    def mp1_case(method):
+        def run(maze):
+            stats = mp1.SearchStats()
+            return method(maze, stats=stats), stats
+        return run
+
+    def mp2_case(method):
+        def run(maze):
+            stats = mp2.SearchStats()
+            return method(maze, ispart1=True, stats=stats), stats
+        return run
+
+    cases = [
+        ("bfs", mp1_case(mp1.bfs), single),
+        ("astar_single", mp1_case(mp1.astar_single), single),
+        ("jps", mp1_case(mp1.jps), single),
+        ("astar_multiple", mp1_case(mp1.astar_multiple), multiple),
+        ("fast", mp1_case(mp1.fast), multiple),
+        ("robotics_bfs", mp2_case(mp2.bfs), config),
+        ("robotics_astar", mp2_case(mp2.astar), config),
+    ]
+    results = {}
+    for name, run, make_maze in cases:
+        if args.only and name not in args.only:
+            continue
+        results[name] = measure(run, make_maze, args.repeat)
+    return results
+
+
+def format_table(results, baseline=None):
+    columns = ("time", "peak_memory", "expanded", "path_length")
+    header = "{:<16}".format("method") + "".join("{:>24}".format(column) for column in columns)
+    lines = [header, "-" * len(header)]
+    for name, result in results.items():
+        cells = []
+        for column in columns:
+            value = result[column]
+            text = "{:.4f}".format(value) if isinstance(value, float) else str(value)
+            if baseline and name in baseline and baseline[name].get(column):
+                text += " ({:+.1%})".format(value / baseline[name][column] - 1)
+            cells.append("{:>24}".format(text))
+        lines.append("{:<16}".format(name) + "".join(cells))
+    return "\n".join(lines)
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Returns the (method, metric) pairs whose time, memory or expansions grew by more than tolerance over the
+    baseline, or whose path got longer at all.
+    """
+    found = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for column in ("time", "peak_memory", "expanded"):
+            if baseline[name][column] and result[column] > baseline[name][column] * (1 + tolerance):
+                found.append((name, column))
+        if result["path_length"] > baseline[name]["path_length"]:
+            found.append((name, "path_length"))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the MP1 and MP2 search methods on seeded mazes")
+    parser.add_argument("--size", type=int, default=200, help="side length of the single-goal mazes")
+    parser.add_argument("--density", type=float, default=0.2, help="probability of a wall in each cell")
+    parser.add_argument("--waypoints", type=int, default=8, help="waypoints in the multi-goal mazes")
+    parser.add_argument("--seed", type=int, default=440, help="seed for the maze generator")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per method, the best one is kept")
+    parser.add_argument("--only", nargs="*", help="benchmark only these methods")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative growth over the baseline reported as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+    print(format_table(results, baseline))
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"parameters": {key: value for key, value in vars(args).items()
+                                      if key in ("size", "density", "waypoints", "seed", "repeat")},
+                       "results": results}, file, indent=2)
+    if baseline:
+        found = regressions(results, baseline, args.tolerance)
+        for name, column in found:
+            print("regression: {} {}".format(name, column))
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())